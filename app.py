@@ -169,7 +169,5 @@ if __name__ == '__main__':
 
 AI_STREAM_CHUNK_SIZE = 4096
 AI_STREAM_TIMEOUT = 200  
-AI_THROTTLE_MS = 30
 AI_BATCH_SIZE = 128
-AI_NUM_THREADS = -1
-AI_CONTEXT_SIZE = 8192
\ No newline at end of file
+AI_NUM_THREADS = -1
\ No newline at end of file
@@ -40,8 +40,106 @@ AI_BASE_URL = "http://localhost:11434/api/chat"
 AI_MODEL = "Saturno"
 AI_TEMPERATURE = 0.5
 AI_MAX_TOKENS = 1024
+AI_CONTEXT_SIZE = 8192  # maior num_ctx permitido; prompts maiores são truncados
+AI_NUM_CTX_BUCKETS = (2048, 4096, AI_CONTEXT_SIZE)
+AI_NUM_CTX_SHRINK_AFTER = 600  # segundos sem precisar do bucket maior antes de reduzir (evita recarga do modelo)
+
+# Memória contextual das conversas
+CONVERSATION_TOKEN_BUDGET = 1536  # tokens de histórico guardados por sessão
+CONVERSATION_MAX_BYTES = 32 * 1024 * 1024  # teto global; sessões menos recentes saem primeiro
+CONVERSATION_MAX_SESSIONS = 10000
+CONVERSATION_SUMMARY_ENABLED = os.getenv('CONVERSATION_SUMMARY_ENABLED', 'true').lower() == 'true'
+CONVERSATION_SUMMARY_MIN_TOKENS = 256  # tokens fora da janela antes de gerar um resumo
+CONVERSATION_SUMMARY_MAX_TOKENS = 200  # tamanho máximo do resumo (num_predict)
+
+# Cache de respostas do primeiro turno (mesma pergunta, mesmo modo, mesmo prompt)
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+RESPONSE_CACHE_MAX_BYTES = 16 * 1024 * 1024
+RESPONSE_CACHE_TTL = int(os.getenv('RESPONSE_CACHE_TTL', 3600))  # segundos
+
+# Cache semântico (paráfrases do primeiro turno; só respostas com like; requer numpy)
+SEMANTIC_CACHE_ENABLED = os.getenv('SEMANTIC_CACHE_ENABLED', 'true').lower() == 'true'
+SEMANTIC_CACHE_EMBEDDER = os.getenv('SEMANTIC_CACHE_EMBEDDER', 'ollama')  # 'ollama' ou 'local' (hashing, sem modelo)
+SEMANTIC_CACHE_EMBED_MODEL = os.getenv('SEMANTIC_CACHE_EMBED_MODEL', 'nomic-embed-text')
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.92))  # similaridade de cosseno mínima
+SEMANTIC_CACHE_MAX_ENTRIES = 2000
+SEMANTIC_CACHE_TTL = 7 * 24 * 3600  # segundos
+# Likes de usuários autenticados distintos para uma resposta entrar no cache (compartilhado entre todos)
+SEMANTIC_CACHE_MIN_LIKES = int(os.getenv('SEMANTIC_CACHE_MIN_LIKES', 2))
+
+# Primeiros turnos idênticos simultâneos compartilham uma geração no Ollama
+AI_SINGLE_FLIGHT_ENABLED = os.getenv('AI_SINGLE_FLIGHT_ENABLED', 'true').lower() == 'true'
+
+# Rodadas de ferramentas por resposta no streaming (a última responde sem ferramentas)
+AI_MAX_TOOL_DEPTH = 3
+
+# Execução das ferramentas (pool compartilhado, prazos em segundos)
+TOOL_MAX_WORKERS = 8
+TOOL_DEFAULT_TIMEOUT = 5  # memória e data/hora são locais
+TOOL_TIMEOUTS = {'search_web_comprehensive': 15}
+# Só leitura, sem estado compartilhado: rodam em paralelo; as de memória rodam em fila, na ordem pedida
+TOOL_PARALLEL_SAFE = ('search_web_comprehensive', 'obter_data_hora')
+TOOL_TURN_DEADLINE = 20  # prazo total das ferramentas de um turno
+TOOL_RESULT_TOKEN_BUDGET = 600  # tokens por resultado devolvido ao modelo (JSON compacto)
+
+# Busca web: fontes consultadas em paralelo sob um prazo global (segundos)
+WEB_SEARCH_DEADLINE = float(os.getenv('WEB_SEARCH_DEADLINE', 8))
+WEB_SEARCH_MAX_WORKERS = 12  # 3 fontes por busca, até 4 buscas simultâneas
+WIKIPEDIA_API_URL = os.getenv('WIKIPEDIA_API_URL', 'https://api.wikimedia.org/core/v1/wikipedia')
+
+# Cache da busca web (LRU em memória + SQLite); TTL em segundos pela classe da consulta
+SEARCH_CACHE_ENABLED = os.getenv('SEARCH_CACHE_ENABLED', 'true').lower() == 'true'
+SEARCH_CACHE_FILE = Path(os.getenv('SEARCH_CACHE_FILE', BASE_DIR / 'titan_search_cache.db'))
+SEARCH_CACHE_MEMORY_ENTRIES = 500
+SEARCH_CACHE_TTLS = {
+    'news': 15 * 60,  # notícias, cotações, placares
+    'temporal': 3600,  # perguntas com datas e ordem cronológica
+    'default': 6 * 3600,
+    'encyclopedic': 7 * 24 * 3600,  # definições, biografias
+}
+SEARCH_CACHE_STALE_FOR = 24 * 3600  # teto da janela além do TTL (min(ttl, teto)) servida enquanto atualiza
+
+# Pré-roteador: perguntas triviais (data/hora, memória) executam a ferramenta antes da geração
+INTENT_ROUTER_ENABLED = os.getenv('INTENT_ROUTER_ENABLED', 'true').lower() == 'true'
+INTENT_ROUTER_THRESHOLD = 0.9  # confiança mínima do modelo de palavras-chave
+
 AI_TIMEOUT = 300
 
+# Transporte HTTP do Ollama (conexões keep-alive reaproveitadas)
+AI_HOST_URL = AI_BASE_URL.rsplit('/api/', 1)[0]
+AI_HTTP_POOL_SIZE = int(os.getenv('AI_HTTP_POOL_SIZE', MAX_USUARIOS_SIMULTANEOS * 2))
+AI_CONNECT_TIMEOUT = 5
+AI_ENDPOINT_TIMEOUTS = {
+    'chat': 300,        # send_message (sem streaming)
+    'chat_final': 120,  # chamada final após ferramentas
+    'stream': 300,      # send_message_streaming (timeout entre bytes)
+    'tags': 5,          # verificação de disponibilidade
+    'summary': 60,      # resumo de conversas em segundo plano
+    'embed': 10         # embeddings do cache semântico (caminho do request)
+}
+
+# Backends Ollama (lista separada por vírgula; padrão: apenas AI_HOST_URL)
+AI_BACKENDS = [url.strip() for url in os.getenv('AI_BACKENDS', AI_HOST_URL).split(',') if url.strip()]
+AI_BACKEND_EJECT_AFTER = 3      # falhas seguidas até tirar o backend do pool
+AI_BACKEND_EJECT_COOLDOWN = 30  # segundos fora do pool antes de tentar de novo
+AI_KEEP_ALIVE = int(os.getenv('AI_KEEP_ALIVE', 1800))  # segundos que o modelo fica carregado após o último uso
+
+# Monitor de saúde do Ollama (sondagem em background)
+AI_HEALTH_INTERVAL = 15      # segundos entre sondagens com o backend no ar
+AI_HEALTH_MAX_BACKOFF = 120  # teto do backoff exponencial com o backend fora
+
+# Streaming SSE
+SSE_HEARTBEAT_INTERVAL = 10  # segundos sem eventos até enviar um comentário ': ping'
+AI_THROTTLE_MS = 30  # tempo máximo agrupando deltas num mesmo frame SSE
+AI_COALESCE_BYTES = 256  # frame sai antes disso se o texto agrupado passar deste tamanho
+
+# Escalonador de gerações (admissão por plano na frente do Ollama)
+SCHEDULER_MAX_CONCURRENT = int(os.getenv('SCHEDULER_MAX_CONCURRENT', MAX_USUARIOS_SIMULTANEOS))
+SCHEDULER_MAX_QUEUE_SIZE = 100
+SCHEDULER_TIER_WEIGHTS = {'pro': 8, 'basic': 4, 'free': 2, 'anon': 1}  # fatia de vagas por plano
+SCHEDULER_USER_MAX_IN_FLIGHT = {'pro': 3, 'basic': 2, 'free': 1, 'anon': 1}
+SCHEDULER_MAX_QUEUE_WAIT = {'pro': 120, 'basic': 90, 'free': 60, 'anon': 30}  # segundos
+
 # Flask
 SECRET_KEY = os.getenv('SECRET_KEY')
 if not SECRET_KEY:
@@ -0,0 +1,236 @@
+"""
+Escalonador de admissão das gerações por plano (anon/free/basic/pro)
+"""
+import threading
+import time
+import uuid
+from collections import deque
+
+from config import (
+    PLAN_LIMITS,
+    SCHEDULER_MAX_CONCURRENT,
+    SCHEDULER_MAX_QUEUE_SIZE,
+    SCHEDULER_TIER_WEIGHTS,
+    SCHEDULER_USER_MAX_IN_FLIGHT,
+    SCHEDULER_MAX_QUEUE_WAIT
+)
+
+TIER_ANON = 'anon'
+
+TICKET_QUEUED = 'queued'
+TICKET_ADMITTED = 'admitted'
+TICKET_EXPIRED = 'expired'
+TICKET_REJECTED = 'rejected'
+TICKET_CANCELLED = 'cancelled'
+TICKET_RELEASED = 'released'
+
+
+def tier_for_features(features):
+    """Plano mais alto cujas features o usuário possui (PLAN_LIMITS)"""
+    owned = set(features or [])
+    for tier in ('pro', 'basic', 'free'):
+        if set(PLAN_LIMITS[tier]['features']) <= owned:
+            return tier
+    return 'free'
+
+
+class GenerationTicket:
+    """Lugar de uma geração na fila; liberar exatamente uma vez"""
+
+    def __init__(self, user_key, tier):
+        self.id = str(uuid.uuid4())
+        self.user_key = user_key
+        self.tier = tier
+        self.state = TICKET_QUEUED
+        self.enqueued_at = time.time()
+        self.admitted_at = None
+        self.admitted = threading.Event()
+
+    @property
+    def wait_seconds(self):
+        end = self.admitted_at or time.time()
+        return end - self.enqueued_at
+
+
+class GenerationScheduler:
+    """Limita as gerações simultâneas no Ollama e ordena a fila por plano.
+
+    Cada plano tem sua própria fila FIFO; entre planos a vaga livre vai para
+    a fila com menor tempo virtual, que avança 1/peso a cada admissão, então
+    sob carga 'pro' recebe `weights['pro']` vagas para cada vaga 'anon' sem
+    que os planos menores fiquem parados. Um usuário nunca ocupa mais que
+    `user_max_in_flight[tier]` vagas; quem espera mais que
+    `max_queue_wait[tier]` segundos desiste com erro.
+    """
+
+    def __init__(self, max_concurrent=5, max_queue_size=100, weights=None,
+                 user_max_in_flight=None, max_queue_wait=None):
+        self.max_concurrent = max_concurrent
+        self.max_queue_size = max_queue_size
+        self.weights = dict(weights or {})
+        self.user_max_in_flight = dict(user_max_in_flight or {})
+        self.max_queue_wait = dict(max_queue_wait or {})
+
+        self._lock = threading.Lock()
+        self._queues = {tier: deque() for tier in self.weights}
+        self._vtime = {tier: 0.0 for tier in self.weights}
+        self._clock = 0.0
+        self._in_flight = 0
+        self._user_in_flight = {}
+        self._stats = {
+            tier: {'admitted': 0, 'expired': 0, 'rejected': 0, 'cancelled': 0,
+                   'total_wait': 0.0, 'max_wait': 0.0}
+            for tier in self.weights
+        }
+        print(f" GenerationScheduler inicializado - {max_concurrent} gerações simultâneas")
+
+    def submit(self, user_key, tier):
+        """Entra na fila (ou é admitido na hora se houver vaga)"""
+        if tier not in self._queues:
+            tier = TIER_ANON
+        ticket = GenerationTicket(user_key, tier)
+
+        with self._lock:
+            if sum(len(q) for q in self._queues.values()) >= self.max_queue_size:
+                ticket.state = TICKET_REJECTED
+                self._stats[tier]['rejected'] += 1
+                return ticket
+
+            queue = self._queues[tier]
+            if not queue:
+                # Fila que estava vazia não acumula crédito do tempo ociosa
+                self._vtime[tier] = max(self._vtime[tier], self._clock)
+            queue.append(ticket)
+            self._dispatch()
+
+        return ticket
+
+    def wait_turn(self, ticket, poll_interval=1.0, should_abort=None):
+        """Gerador: espera a vez emitindo eventos 'queued' quando a posição muda.
+
+        Ao terminar `ticket.state` diz se a geração foi admitida.
+        """
+        last_position = None
+        while ticket.state == TICKET_QUEUED:
+            if ticket.admitted.wait(poll_interval):
+                break
+
+            if should_abort and should_abort():
+                self._leave(ticket, TICKET_CANCELLED)
+                break
+            if ticket.wait_seconds > self.max_queue_wait.get(ticket.tier, 60):
+                self._leave(ticket, TICKET_EXPIRED)
+                break
+
+            position = self.position(ticket)
+            if position and position != last_position:
+                last_position = position
+                yield {
+                    "type": "queued",
+                    "position": position,
+                    "tier": ticket.tier,
+                    "waited": round(ticket.wait_seconds, 1)
+                }
+
+    def position(self, ticket):
+        """Posição (1 = próximo) dentro da fila do plano; 0 se já saiu da fila"""
+        with self._lock:
+            try:
+                return self._queues[ticket.tier].index(ticket) + 1
+            except ValueError:
+                return 0
+
+    def release(self, ticket):
+        """Devolve a vaga (ou sai da fila se ainda não foi admitido)"""
+        if ticket.state == TICKET_QUEUED:
+            self._leave(ticket, TICKET_CANCELLED)
+            return
+
+        with self._lock:
+            if ticket.state != TICKET_ADMITTED:
+                return
+            ticket.state = TICKET_RELEASED
+            self._in_flight -= 1
+            remaining = self._user_in_flight.get(ticket.user_key, 1) - 1
+            if remaining > 0:
+                self._user_in_flight[ticket.user_key] = remaining
+            else:
+                self._user_in_flight.pop(ticket.user_key, None)
+            self._dispatch()
+
+    def _leave(self, ticket, state):
+        with self._lock:
+            if ticket.state != TICKET_QUEUED:
+                return
+            try:
+                self._queues[ticket.tier].remove(ticket)
+            except ValueError:
+                pass
+            ticket.state = state
+            self._stats[ticket.tier][state] += 1
+        if state == TICKET_EXPIRED:
+            print(f" [SCHEDULER] Ticket {ticket.id[:8]}... ({ticket.tier}) desistiu após {ticket.wait_seconds:.0f}s na fila")
+
+    def _dispatch(self):
+        """Admite tickets enquanto houver vaga (chamar com lock)"""
+        while self._in_flight < self.max_concurrent:
+            ticket = self._next_ticket()
+            if ticket is None:
+                return
+
+            self._queues[ticket.tier].remove(ticket)
+            self._vtime[ticket.tier] += 1.0 / self.weights[ticket.tier]
+            self._clock = min((self._vtime[t] for t, q in self._queues.items() if q), default=self._clock)
+            self._in_flight += 1
+            self._user_in_flight[ticket.user_key] = self._user_in_flight.get(ticket.user_key, 0) + 1
+
+            ticket.state = TICKET_ADMITTED
+            ticket.admitted_at = time.time()
+            stats = self._stats[ticket.tier]
+            stats['admitted'] += 1
+            stats['total_wait'] += ticket.wait_seconds
+            stats['max_wait'] = max(stats['max_wait'], ticket.wait_seconds)
+            ticket.admitted.set()
+
+    def _next_ticket(self):
+        """Primeiro ticket elegível da fila com menor tempo virtual"""
+        for tier in sorted((t for t, q in self._queues.items() if q), key=lambda t: self._vtime[t]):
+            cap = self.user_max_in_flight.get(tier, 1)
+            for ticket in self._queues[tier]:
+                if self._user_in_flight.get(ticket.user_key, 0) < cap:
+                    return ticket
+        return None
+
+    def has_spare_capacity(self):
+        """Há vaga livre e ninguém esperando (para trabalho de baixa prioridade)"""
+        with self._lock:
+            return self._in_flight < self.max_concurrent and not any(self._queues.values())
+
+    def get_stats(self):
+        with self._lock:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'in_flight': self._in_flight,
+                'queued': sum(len(q) for q in self._queues.values()),
+                'tiers': {
+                    tier: {
+                        'queued': len(self._queues[tier]),
+                        'admitted': stats['admitted'],
+                        'expired': stats['expired'],
+                        'rejected': stats['rejected'],
+                        'cancelled': stats['cancelled'],
+                        'avg_wait_ms': round(stats['total_wait'] / stats['admitted'] * 1000, 1) if stats['admitted'] else 0,
+                        'max_wait_ms': round(stats['max_wait'] * 1000, 1)
+                    }
+                    for tier, stats in self._stats.items()
+                }
+            }
+
+
+generation_scheduler = GenerationScheduler(
+    max_concurrent=SCHEDULER_MAX_CONCURRENT,
+    max_queue_size=SCHEDULER_MAX_QUEUE_SIZE,
+    weights=SCHEDULER_TIER_WEIGHTS,
+    user_max_in_flight=SCHEDULER_USER_MAX_IN_FLIGHT,
+    max_queue_wait=SCHEDULER_MAX_QUEUE_WAIT
+)
@@ -1,6 +1,6 @@
 import threading
 import time
-from typing import Dict, Optional
+from typing import Any, Dict, Optional
 from dataclasses import dataclass
 import uuid
 
@@ -11,11 +11,21 @@ class ActiveRequest:
     timestamp: float
     cancelled: bool = False
     thread_id: Optional[int] = None
+    upstream: Optional[Any] = None  # resposta em streaming do Ollama (tem .close())
+    cancelled_at: Optional[float] = None
 
 class RequestManager:
     def __init__(self):
         self.active_requests: Dict[str, ActiveRequest] = {}
         self.lock = threading.Lock()
+        self.cancel_stats = {
+            'cancelled': 0,
+            'abandoned': 0,
+            'upstream_closed': 0,
+            'total_close_ms': 0.0,
+            'max_close_ms': 0.0,
+            'last_close_ms': None
+        }
         print(" RequestManager inicializado")
     
     def start_request(self, session_id: str) -> str:
@@ -38,7 +48,8 @@ class RequestManager:
             thread_id=threading.current_thread().ident
         )
         
-        self.active_requests[request_id] = request
+        with self.lock:
+            self.active_requests[request_id] = request
         print(f"Request {request_id[:8]}... iniciada para sessão {session_id[:8]}...")
         
         return request_id
@@ -50,26 +61,105 @@ class RequestManager:
                 del self.active_requests[request_id]
                 print(f" Request {request_id[:8]}... finalizada")
     
+    def attach_upstream(self, request_id: str, upstream) -> bool:
+        """Associa a conexão de streaming do Ollama à request.
+
+        Retorna False se a request já foi cancelada (o chamador deve abortar).
+        """
+        with self.lock:
+            request = self.active_requests.get(request_id)
+            if request is None or request.cancelled:
+                return False
+            request.upstream = upstream
+            return True
+
     def cancel_request(self, request_id: str):
-        """Cancela request específica"""
+        """Cancela request específica e fecha a conexão com o Ollama"""
         with self.lock:
-            if request_id in self.active_requests:
-                self.active_requests[request_id].cancelled = True
-                print(f" Request {request_id[:8]}... cancelada")
-                return True
-        return False
+            request = self.active_requests.get(request_id)
+            if request is None:
+                return False
+            upstream = self._mark_cancelled(request)
+            print(f" Request {request_id[:8]}... cancelada")
+
+        self._close_upstream(upstream)
+        return True
     
+    def abandon_request(self, request_id: str):
+        """Cliente desconectou no meio do stream: cancela e contabiliza como abandonada"""
+        with self.lock:
+            request = self.active_requests.get(request_id)
+            if request is None or request.cancelled:
+                return False
+            upstream = self._mark_cancelled(request)
+            self.cancel_stats['abandoned'] += 1
+            print(f" Request {request_id[:8]}... abandonada pelo cliente")
+
+        self._close_upstream(upstream)
+        return True
+
     def cancel_session_requests(self, session_id: str):
         """Cancela todas as requests de uma sessão"""
-        cancelled_count = 0
-        for request in self.active_requests.values():
-            if request.session_id == session_id and not request.cancelled:
-                request.cancelled = True
-                cancelled_count += 1
-                print(f" Request {request.id[:8]}... da sessão {session_id[:8]}... cancelada")
-        
-        if cancelled_count > 0:
-            print(f" Total: {cancelled_count} requests canceladas da sessão {session_id[:8]}...")
+        to_close = []
+        with self.lock:
+            for request in self.active_requests.values():
+                if request.session_id == session_id and not request.cancelled:
+                    to_close.append(self._mark_cancelled(request))
+                    print(f" Request {request.id[:8]}... da sessão {session_id[:8]}... cancelada")
+
+        for upstream in to_close:
+            self._close_upstream(upstream)
+
+        if to_close:
+            print(f" Total: {len(to_close)} requests canceladas da sessão {session_id[:8]}...")
+
+    def _mark_cancelled(self, request: ActiveRequest):
+        """Marca como cancelada (chamar com lock) e devolve o upstream a fechar"""
+        if not request.cancelled:
+            request.cancelled = True
+            request.cancelled_at = time.time()
+            self.cancel_stats['cancelled'] += 1
+        return request.upstream
+
+    def _close_upstream(self, upstream):
+        """Fecha a resposta em streaming: o Ollama para de gerar ao perder a conexão"""
+        if upstream is None:
+            return
+        try:
+            upstream.close()
+        except Exception as e:
+            print(f" Erro ao fechar conexão com o Ollama: {e}")
+
+    def mark_upstream_closed(self, request_id: str):
+        """Chamado pelo stream ao liberar a conexão; mede cancelamento -> fechamento"""
+        with self.lock:
+            request = self.active_requests.get(request_id)
+            if request is None:
+                return
+            request.upstream = None
+            if request.cancelled_at is None:
+                return
+
+            elapsed_ms = (time.time() - request.cancelled_at) * 1000
+            stats = self.cancel_stats
+            stats['upstream_closed'] += 1
+            stats['total_close_ms'] += elapsed_ms
+            stats['max_close_ms'] = max(stats['max_close_ms'], elapsed_ms)
+            stats['last_close_ms'] = round(elapsed_ms, 1)
+        print(f" Request {request_id[:8]}... upstream fechado {elapsed_ms:.0f}ms após o cancelamento")
+
+    def get_cancel_stats(self):
+        """Estatísticas de cancelamento"""
+        with self.lock:
+            stats = self.cancel_stats
+            return {
+                'cancelled': stats['cancelled'],
+                'abandoned': stats['abandoned'],
+                'upstream_closed': stats['upstream_closed'],
+                'avg_close_ms': round(stats['total_close_ms'] / stats['upstream_closed'], 1) if stats['upstream_closed'] else None,
+                'max_close_ms': round(stats['max_close_ms'], 1),
+                'last_close_ms': stats['last_close_ms']
+            }
     
     def is_cancelled(self, request_id: str) -> bool:
         """Verifica se request foi cancelada"""
@@ -83,13 +173,14 @@ class RequestManager:
             return len([r for r in self.active_requests.values() if not r.cancelled])
     
     def cleanup_old_requests(self):
-        """Limpa requests antigas (mais de 5 minutos)"""
-        cutoff_time = time.time() - 300
+        """Limpa requests antigas (mais de 5 minutos; 30 se ainda estiverem em streaming)"""
+        now = time.time()
         
         with self.lock:
             to_remove = []
             for request_id, request in self.active_requests.items():
-                if request.timestamp < cutoff_time:
+                max_age = 1800 if request.upstream is not None and not request.cancelled else 300
+                if request.timestamp < now - max_age:
                     to_remove.append(request_id)
             
             for request_id in to_remove:
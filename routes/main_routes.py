@@ -8,11 +8,17 @@ from flask import Blueprint, app, request, jsonify, session, render_template, Re
 from models import auth_manager, rate_limiter
 from models.session_manager import session_manager
 from models.database import db_manager
-from utils.ai_client import ai_client
+from utils.ai_client import ai_client, titan_memory, conversation_summarizer, tools_for_features
 from models.request_manager import request_manager
+from models.generation_scheduler import generation_scheduler, tier_for_features, TIER_ANON, TICKET_ADMITTED, TICKET_CANCELLED, TICKET_REJECTED
 from models.cache_manager import context_cache, cache_context
+from utils.sse_protocol import SSEEncoder
+from utils.sse_heartbeat import relay_with_heartbeat
+from utils.generation_telemetry import generation_telemetry
+from tools.web_search import search_source_stats
+from tools.search_cache import search_cache
 import requests
-from config import DATABASE_FILE, FEEDBACK_DATABASE_FILE
+from config import DATABASE_FILE, FEEDBACK_DATABASE_FILE, SSE_HEARTBEAT_INTERVAL
 from flask_wtf.csrf import CSRFProtect, validate_csrf
 from flask_wtf import FlaskForm
 from wtforms import StringField, TextAreaField
@@ -114,7 +120,8 @@ def create_main_blueprint(csrf):
             'maximo_usuarios': status_data['maximo_usuarios'],
             'disponivel': status_data['usuarios_ativos'] < status_data['maximo_usuarios'],
             'fila_espera': status_data['fila_espera'],
-            'stats': status_data['stats']
+            'stats': status_data['stats'],
+            'ia': dict(ai_client.backends.get_health_state(), transicoes=ai_client.backends.get_transitions())
         })
 
     @cache_context(timeout=300)
@@ -253,6 +260,8 @@ def create_main_blueprint(csrf):
             print(f" [DEBUG CHAT] Data (após parsing): {data}")
             mensagem = data.get('mensagem', '').strip()
             thinking_mode = data.get('thinking_mode', False)
+            # Protocolo SSE: 1 = legado (com buffer acumulado), 2 = compacto só com deltas
+            stream_encoder = SSEEncoder(data.get('stream_protocol'))
             print(f" [DEBUG CHAT] Mensagem extraída: '{mensagem}'")
             print(f" [DEBUG CHAT] Thinking mode extraído: {thinking_mode}")
             
@@ -268,10 +277,13 @@ def create_main_blueprint(csrf):
                     'action_required': 'create_account'
                 }), 402  # Payment Required
 
+            plan_tier = TIER_ANON
+            features = []  # anônimo: mesmas ferramentas do plano gratuito
             if is_authenticated:
                 # Verificar se o plano permite thinking mode
                 user_limits = auth_manager.get_user_limits(user_id)
                 features = user_limits.get('features', [])
+                plan_tier = tier_for_features(features)
                 
                 if thinking_mode and 'thinking_mode' not in features:
                     return jsonify({
@@ -281,20 +293,18 @@ def create_main_blueprint(csrf):
                         'current_plan': user_limits.get('plan_name', 'Gratuito')
                     }), 402
 
-            # 6. VERIFICAR OLLAMA
-            try:
-                test_response = requests.get("http://localhost:11434/api/tags", timeout=5)
-                if test_response.status_code != 200:
-                    return jsonify({'error': 'IA temporariamente indisponível'}), 503
-            except:
+            # 6. VERIFICAR OLLAMA (estado em cache do monitor de saúde, sem round trip)
+            ia_status = ai_client.backends.get_health_state()['status']
+            if ia_status == 'down':
                 return jsonify({'error': 'IA offline'}), 503
+            if ia_status == 'degraded':
+                return jsonify({'error': 'IA temporariamente indisponível'}), 503
 
-            # 7. REQUEST MANAGER
-            request_id = str(uuid.uuid4())
+            # 7. REQUEST MANAGER (registra o stream para permitir cancelamento real)
+            request_id = request_manager.start_request(session_id)
             
-            # 8. MENSAGENS
+            # 8. MENSAGENS (o system prompt com prefixo estável é montado pelo ai_client)
             messages = [
-                {"role": "system", "content": "Você é o Titan, um assistente inteligente."},
                 {"role": "user", "content": mensagem}
             ]
 
@@ -305,22 +315,76 @@ def create_main_blueprint(csrf):
 
             print(f"[AI] Thinking solicitado={thinking_mode}, final={final_thinking_mode}")
 
+            # Ferramentas do plano (busca web e memória só para quem tem a feature)
+            allowed_tools = tools_for_features(features)
+
             # 10. STREAM GENERATOR
             def generate():
+                # CACHE DE RESPOSTAS: pergunta repetida de primeiro turno não passa pela fila nem pelo Ollama
+                cached = ai_client.cached_response(mensagem, final_thinking_mode, session_id, allowed_tools)
+                # SINGLE-FLIGHT: pergunta idêntica já sendo gerada só ocupa vaga na fila se precisar de rodada própria
+                flight = None if cached else ai_client.join_generation(
+                    mensagem, final_thinking_mode, session_id, allowed_tools
+                )
+                ticket = None
+
+                def admit():
+                    """FILA DE ADMISSÃO: aguarda vaga no Ollama informando a posição; retorna se foi admitido"""
+                    nonlocal ticket
+                    if ticket is None:
+                        ticket = generation_scheduler.submit(user_id if is_authenticated else session_id, plan_tier)
+                    yield from generation_scheduler.wait_turn(
+                        ticket,
+                        should_abort=lambda: request_manager.is_cancelled(request_id)
+                    )
+
+                    if ticket.state == TICKET_ADMITTED:
+                        return True
+                    if ticket.state == TICKET_CANCELLED:
+                        yield {"type": "cancelled", "partial_chars": 0}
+                    else:
+                        if ticket.state == TICKET_REJECTED:
+                            message = 'Servidor sobrecarregado. Tente novamente em instantes.'
+                        else:
+                            message = 'Tempo de espera na fila esgotado. Tente novamente.'
+                        yield {"type": "error", "error": message, "queue_state": ticket.state}
+                    return False
+
                 try:
-                    chunks_received = 0
-                    for chunk in ai_client.send_message_streaming(
-                        messages,
-                        use_tools=True,
-                        thinking_mode=final_thinking_mode,
-                        session_id=session_id,
-                        request_id=request_id
-                    ):
-                        yield f"data: {json.dumps(chunk, ensure_ascii=False, separators=(',', ':'))}\n\n"
-                        chunks_received += 1
+                    # Só texto gerado (ou servido do cache/geração compartilhada) conta como uso;
+                    # posição na fila, recusa por sobrecarga e erros não são cobrados
+                    content_chunks = 0
+                    opening = stream_encoder.open()
+                    if opening:
+                        yield opening
+
+                    if cached:
+                        source = ai_client.replay_cached_response(
+                            cached,
+                            mensagem,
+                            thinking_mode=final_thinking_mode,
+                            session_id=session_id
+                        )
+                    else:
+                        # Geração compartilhada (flight) só entra na fila se precisar de rodada própria
+                        source = ai_client.send_message_streaming(
+                            messages,
+                            use_tools=True,
+                            thinking_mode=final_thinking_mode,
+                            session_id=session_id,
+                            request_id=request_id,
+                            flight=flight,
+                            admit=admit,
+                            allowed_tools=allowed_tools
+                        )
+
+                    for chunk in source:
+                        yield stream_encoder.encode(chunk)
+                        if chunk.get("type") in ("content", "thinking"):
+                            content_chunks += 1
                         
                     # REGISTRAR USO APÓS STREAM COMPLETO
-                    if chunks_received > 0:
+                    if content_chunks > 0:
                         if is_authenticated:
                             # Usuário autenticado - usar rate limiter normal
                             rate_limiter.track_message_usage(
@@ -342,22 +406,36 @@ def create_main_blueprint(csrf):
                                 "limit": 5,
                                 "limit_reached": usage_result['limit_reached']
                             }
-                            yield f"data: {json.dumps(limit_chunk)}\n\n"
+                            yield stream_encoder.encode(limit_chunk)
                         
                 except PermissionError as pe:
                     error_chunk = {"type": "error", "error": str(pe), "action_required": "create_account"}
-                    yield f"data: {json.dumps(error_chunk, ensure_ascii=False, separators=(',', ':'))}\n\n"
+                    yield stream_encoder.encode(error_chunk)
                 except Exception as e:
                     error_chunk = {"type": "error", "error": str(e)}
-                    yield f"data: {json.dumps(error_chunk, ensure_ascii=False, separators=(',', ':'))}\n\n"
+                    yield stream_encoder.encode(error_chunk)
+                finally:
+                    if flight:
+                        flight.leave()
+                    if ticket:
+                        generation_scheduler.release(ticket)
+                    request_manager.finish_request(request_id)
+
+            # Heartbeats mantêm o socket ativo; se o cliente sumir a geração é abortada
+            stream = relay_with_heartbeat(
+                generate(),
+                SSE_HEARTBEAT_INTERVAL,
+                on_abandon=lambda: request_manager.abandon_request(request_id)
+            )
 
             return Response(
-                stream_with_context(generate()),
+                stream_with_context(stream),
                 mimetype='text/event-stream',
                 headers={
                 'Cache-Control': 'no-cache',
                 'Connection': 'keep-alive',
-                'X-Accel-Buffering': 'no'
+                'X-Accel-Buffering': 'no',
+                'X-Stream-Protocol': str(stream_encoder.protocol)
             }
             )
 
@@ -530,7 +608,30 @@ def create_main_blueprint(csrf):
     @main_bp.route('/admin/stats')
     def admin_stats():
         """Estatísticas do sistema"""
-        return jsonify(session_manager.get_status())
+        stats = session_manager.get_status()
+        stats['ollama_backends'] = ai_client.backends.get_stats()
+        stats['cancelamentos'] = request_manager.get_cancel_stats()
+        stats['fila_geracao'] = generation_scheduler.get_stats()
+        stats['telemetria_geracao'] = generation_telemetry.get_stats()
+        stats['residencia_modelos'] = ai_client.residency.get_stats()
+        stats['contexto'] = ai_client.context_budget.get_stats()
+        stats['memoria_conversas'] = titan_memory.get_stats()
+        if ai_client.response_cache:
+            stats['cache_respostas'] = ai_client.response_cache.get_stats()
+        if ai_client.semantic_cache:
+            stats['cache_semantico'] = ai_client.semantic_cache.get_stats()
+        if ai_client.single_flight:
+            stats['geracoes_compartilhadas'] = ai_client.single_flight.get_stats()
+        stats['ferramentas'] = ai_client.tool_executor.get_stats()
+        stats['resultados_ferramentas'] = ai_client.tool_result_encoder.get_stats()
+        stats['busca_web'] = search_source_stats.get_stats()
+        if search_cache:
+            stats['cache_busca'] = search_cache.get_stats()
+        if ai_client.intent_router:
+            stats['pre_roteador'] = ai_client.intent_router.get_stats()
+        if conversation_summarizer:
+            stats['resumos'] = conversation_summarizer.get_stats()
+        return jsonify(stats)
 
     @main_bp.route('/end-session', methods=['POST'])
     def end_session():
@@ -572,6 +673,13 @@ def create_main_blueprint(csrf):
                 thinking_mode=thinking_mode,
                 user_agent=user_agent
             )
+
+            # Likes de usuários autenticados numa resposta de primeiro turno a admitem no cache semântico
+            # (o usuário vem da sessão Flask, não do corpo); dislike a remove
+            if resultado.get('status') == 'sucesso' and ai_client.semantic_cache:
+                ai_client.semantic_cache.record_feedback(
+                    session_id, feedback_type, content, user_id=session.get('user_id')
+                )
             
             return jsonify(resultado), 200
             
@@ -923,6 +1031,8 @@ def create_main_blueprint(csrf):
             feedback_stats = feedback_db.obter_estatisticas()
             from models.cache_manager import context_cache
             cache_stats = context_cache.get_stats()
+            response_cache_stats = ai_client.response_cache.get_stats() if ai_client.response_cache else None
+            semantic_cache_stats = ai_client.semantic_cache.get_stats() if ai_client.semantic_cache else None
             
             return jsonify({
                 'timestamp': datetime.now().isoformat(),
@@ -930,7 +1040,17 @@ def create_main_blueprint(csrf):
                 'total_requests': session_stats['stats']['total_requests'],
                 'uptime_horas': round(session_stats['uptime'] / 3600, 1),
                 'aprovacao': feedback_stats.get('aprovacao', 0),
-                'cache_hit_rate': round((cache_stats['cached_sessions'] / max(cache_stats['total_tracked'], 1)) * 100, 1)
+                'cache_hit_rate': round((cache_stats['cached_sessions'] / max(cache_stats['total_tracked'], 1)) * 100, 1),
+                'cache_respostas': {
+                    'hit_ratio': response_cache_stats['hit_ratio'],
+                    'saved_seconds': response_cache_stats['saved_seconds'],
+                    'entries': response_cache_stats['entries']
+                } if response_cache_stats else None,
+                'cache_semantico': {
+                    'hit_ratio': semantic_cache_stats['hit_ratio'],
+                    'saved_seconds': semantic_cache_stats['saved_seconds'],
+                    'entries': semantic_cache_stats['entries']
+                } if semantic_cache_stats else None
             })
         except Exception as e:
             return jsonify({'erro': str(e)}), 500
@@ -738,6 +738,14 @@ async function streamWithFetchStream(message, container) {
                             if (contentDiv) {
                                 contentDiv.textContent = finalText;
                             }
+                        } else if (json.type === 'blocked') {
+                            // Filtro de segurança cortou a resposta: descartar o parcial já exibido
+                            finalText = '';
+                            if (contentDiv) {
+                                contentDiv.textContent = json.error;
+                            }
+                            reader.cancel();
+                            return finalText;
                         }
                     } catch (e) {
                         // Ignorar erros de JSON
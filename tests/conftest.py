@@ -0,0 +1,7 @@
+import os
+import sys
+
+# config.py exige SECRET_KEY já no import
+os.environ.setdefault('SECRET_KEY', 'test-secret-key')
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,89 @@
+import http.server
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from utils.backend_pool import BackendPool
+
+
+def fake_backend(delay=0.0, status=200):
+    """Ollama falso: /api/chat responde depois de `delay`s com `status`"""
+    served = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            served.append(self.path)
+            time.sleep(delay)
+            body = json.dumps({"message": {"content": "ok"}, "done": True}).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, served
+
+
+@pytest.fixture
+def backends():
+    started = []
+
+    def start(**kwargs):
+        server, served = fake_backend(**kwargs)
+        started.append(server)
+        return f"http://127.0.0.1:{server.server_port}", served
+
+    yield start
+    for server in started:
+        server.shutdown()
+
+
+def generate(pool):
+    lease = pool.acquire('Saturno')
+    try:
+        response = lease.transport.post_chat({"model": "Saturno", "messages": []})
+    except Exception:
+        lease.release(error=True)
+        raise
+    lease.release(error=response.status_code >= 500, model='Saturno')
+    return lease.backend.url
+
+
+def test_slow_backend_gets_fewer_generations(backends):
+    slow_url, slow = backends(delay=0.3)
+    fast_url, fast = backends(delay=0.01)
+    pool = BackendPool([slow_url, fast_url], load_penalty=0)
+
+    with ThreadPoolExecutor(max_workers=4) as workers:
+        urls = list(workers.map(lambda _: generate(pool), range(24)))
+
+    assert urls.count(fast_url) > 2 * urls.count(slow_url)
+    assert all(b['in_flight'] == 0 for b in pool.get_stats())
+
+
+def test_failing_backend_is_ejected_and_traffic_fails_over(backends):
+    bad_url, bad = backends(status=500)
+    good_url, good = backends()
+    pool = BackendPool([bad_url, good_url], eject_after=2, eject_cooldown=60, load_penalty=0)
+
+    for _ in range(6):
+        generate(pool)
+    stats = {b['url']: b for b in pool.get_stats()}
+    assert stats[bad_url]['ejected']
+    assert stats[bad_url]['errors'] == 2
+
+    before = len(bad)
+    assert {generate(pool) for _ in range(10)} == {good_url}
+    assert len(bad) == before
@@ -0,0 +1,76 @@
+from utils.context_budget import ContextBudget
+from utils.conversation_store import ConversationStore
+from utils.conversation_summarizer import ConversationSummarizer
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=""):
+        self.status_code = status_code
+        self._content = content
+
+    def json(self):
+        return {"message": {"content": self._content}}
+
+
+class FakeResidency:
+    def keep_alive_param(self):
+        return "5m"
+
+
+class FakeClient:
+    model = "fake"
+
+    def __init__(self, responses):
+        self.context_budget = ContextBudget(buckets=(2048, 4096))
+        self.residency = FakeResidency()
+        self.responses = list(responses)
+        self.payloads = []
+
+    def _post_chat(self, payload, endpoint=None):
+        self.payloads.append(payload)
+        return self.responses.pop(0)
+
+
+def make(responses, token_budget=60):
+    store = ConversationStore(token_budget=token_budget)
+    client = FakeClient(responses)
+    summarizer = ConversationSummarizer(store, client, max_tokens=100, min_tokens=10 ** 9)
+    return store, client, summarizer
+
+
+def fill(store, session_id, count, text="mensagem antiga " * 10):
+    for i in range(count):
+        store.add_message(session_id, 'user' if i % 2 == 0 else 'assistant', f"{i} {text}")
+
+
+def test_failed_summary_keeps_folded_messages():
+    store, client, summarizer = make([FakeResponse(500), FakeResponse(200, "Resumo.")])
+    fill(store, 's1', 6)
+    _, pending = store.peek_fold('s1')
+    assert pending
+
+    summarizer._summarize('s1')
+    assert store.get_summary('s1') == ""
+    assert store.peek_fold('s1')[1] == pending
+
+    summarizer._summarize('s1')
+    assert store.get_summary('s1') == "Resumo."
+    assert store.peek_fold('s1') == (None, [])
+
+
+def test_summary_request_sends_num_ctx_and_fits_the_transcript():
+    # pendentes chegam a 4x o orçamento da janela: mais que o maior bucket comporta
+    store, client, summarizer = make([FakeResponse(200, "Resumo.")], token_budget=1000)
+    fill(store, 's2', 80, text="x" * 400)
+    _, pending = store.peek_fold('s2')
+
+    summarizer._summarize('s2')
+
+    payload = client.payloads[0]
+    budget = client.context_budget
+    assert payload["options"]["num_ctx"] in budget.buckets
+    assert budget.estimate(payload["messages"], "fake") <= budget.prompt_limit("fake", 100)
+    # o que não coube continua pendente para a próxima rodada
+    remaining = store.peek_fold('s2')[1]
+    assert remaining and len(remaining) < len(pending)
+    assert remaining == pending[-len(remaining):]
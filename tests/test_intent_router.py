@@ -0,0 +1,51 @@
+import pytest
+
+from utils.intent_router import IntentRouter
+
+
+@pytest.fixture(scope='module')
+def router():
+    return IntentRouter(threshold=0.9)
+
+
+@pytest.mark.parametrize("message, intent", [
+    ("Que dia é hoje?", 'obter_data_hora'),
+    ("qual a data de hoje", 'obter_data_hora'),
+    ("Qual é a data atual?", 'obter_data_hora'),
+    ("que horas são agora?", 'obter_data_hora'),
+    ("me diga a hora", 'obter_data_hora'),
+    ("em que ano estamos", 'obter_data_hora'),
+    ("hoje é que dia da semana?", 'obter_data_hora'),
+    ("qual o meu nome", 'buscar_dados'),
+    ("Qual é o meu nome?", 'buscar_dados'),
+    ("qual meu nome?", 'buscar_dados'),
+    ("você sabe meu nome?", 'buscar_dados'),
+    ("como eu me chamo?", 'buscar_dados'),
+    ("o que você sabe sobre mim?", 'buscar_dados'),
+    ("vc lembra de mim", 'buscar_dados'),
+])
+def test_routes_common_phrasings(router, message, intent):
+    assert router.route(message) == intent
+
+
+@pytest.mark.parametrize("message", [
+    "a data",
+    "o meu nome",
+    "dia de hoje",
+    "a data da prova",
+    "mude a data",
+    "salve a data do meu aniversário",
+    "qual a data da independência",
+    "a data de hoje foi boa",
+    "o meu nome é Ana",
+    "qual o nome do meu cachorro",
+    "que dia é amanhã",
+    "quantos dias faltam para o natal",
+])
+def test_does_not_route_fragments_or_other_questions(router, message):
+    assert router.route(message) is None
+
+
+def test_plan_without_the_tool_is_not_routed(router):
+    assert router.route("qual o meu nome", allowed_tools=('obter_data_hora',)) is None
+    assert not router.matches("qual o meu nome", allowed_tools=('obter_data_hora',))
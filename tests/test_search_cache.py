@@ -0,0 +1,71 @@
+import os
+import sqlite3
+
+import pytest
+
+from tools.search_cache import SearchCache, classify_query, normalize_query
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("Cotação do dólar hoje", 'news'),
+    ("quem é o presidente do Brasil", 'default'),
+    ("quem e o atual técnico da seleção", 'default'),
+    ("o que é o cargo de ministro", 'default'),
+    ("quando começou a segunda guerra", 'temporal'),
+    ("O que é fotossíntese?", 'encyclopedic'),
+    ("quem foi Santos Dumont", 'encyclopedic'),
+    ("receita de bolo de cenoura", 'default'),
+])
+def test_classify_query(query, expected):
+    assert classify_query(query) == expected
+
+
+def test_normalized_queries_share_an_entry(tmp_path):
+    cache = SearchCache(str(tmp_path / 'cache.db'))
+    cache.put("Preço do DÓLAR  hoje", {'status': 'sucesso', 'resultados': [1]})
+    assert normalize_query("preco dolar hoje") == "preco dolar hoje"
+    resultado, fresh = cache.get("preco dolar hoje")
+    assert fresh and resultado['resultados'] == [1]
+
+
+def test_database_is_created_on_first_store(tmp_path):
+    db_file = str(tmp_path / 'cache.db')
+    cache = SearchCache(db_file)
+    assert cache.get("qualquer coisa") == (None, False)
+    assert not os.path.exists(db_file)
+
+    cache.put("qualquer coisa", {'status': 'sucesso'})
+    assert os.path.exists(db_file)
+    # outro processo (memória vazia) lê do disco
+    assert SearchCache(db_file).get("qualquer coisa")[0]['status'] == 'sucesso'
+
+
+def _age(cache, query, seconds):
+    """Envelhece a entrada em memória e no disco"""
+    key = normalize_query(query)
+    cache._memory[key]['stored_at'] -= seconds
+    conn = sqlite3.connect(cache.db_file)
+    conn.execute("UPDATE search_cache SET stored_at = stored_at - ? WHERE chave = ?", (seconds, key))
+    conn.commit()
+    conn.close()
+
+
+def test_stale_window_follows_the_ttl_class(tmp_path):
+    ttls = {'news': 900, 'default': 6 * 3600, 'encyclopedic': 7 * 24 * 3600}
+    cache = SearchCache(str(tmp_path / 'cache.db'), ttls=ttls, stale_for=24 * 3600)
+    news = "cotação do dólar hoje"
+    cache.put(news, {'status': 'sucesso'})
+
+    _age(cache, news, 900 + 600)
+    resultado, fresh = cache.get(news)
+    assert resultado is not None and not fresh  # vencida, dentro da janela: servida enquanto atualiza
+
+    _age(cache, news, 600)  # passou de ttl + janela (900 + 900), longe das 24h
+    assert cache.get(news) == (None, False)
+
+    encyclopedic = "o que é fotossíntese"
+    cache.put(encyclopedic, {'status': 'sucesso'})
+    _age(cache, encyclopedic, 7 * 24 * 3600 + 23 * 3600)
+    assert cache.get(encyclopedic)[0] is not None
+    _age(cache, encyclopedic, 2 * 3600)
+    assert cache.get(encyclopedic) == (None, False)
@@ -0,0 +1,49 @@
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from utils.semantic_cache import SemanticCache, HashingEmbedder
+
+QUESTION = "qual a capital da franca"
+ANSWER = "A capital da França é Paris."
+
+
+def make(**kwargs):
+    return SemanticCache(HashingEmbedder(), threshold=0.9, max_entries=10, **kwargs)
+
+
+def show(cache, session_id, content=ANSWER):
+    cache.remember_candidate(session_id, QUESTION, False, "m", "v1", content)
+
+
+def test_one_account_cannot_admit_an_answer():
+    cache = make(min_likes=2)
+    show(cache, "s-attacker")
+
+    assert not cache.record_feedback("s-attacker", "like", ANSWER)  # anônimo
+    assert not cache.record_feedback("s-attacker", "like", ANSWER, user_id=1)
+    assert not cache.record_feedback("s-attacker", "like", ANSWER, user_id=1)
+    assert cache.lookup(QUESTION, False, "m", "v1") is None
+
+
+def test_likes_from_distinct_users_on_the_same_answer_admit_it():
+    cache = make(min_likes=2)
+    show(cache, "s1")
+    show(cache, "s2")  # mesma resposta repetida pelo ResponseCache
+
+    assert not cache.record_feedback("s1", "like", ANSWER, user_id=1)
+    assert cache.record_feedback("s2", "like", ANSWER, user_id=2)
+    entry = cache.lookup("Qual a capital da franca?", False, "m", "v1")
+    assert entry is not None and entry["content"] == ANSWER
+
+
+def test_expired_entries_are_dropped_before_matching():
+    cache = make(min_likes=1, ttl=60)
+    show(cache, "s1")
+    assert cache.record_feedback("s1", "like", ANSWER, user_id=1)
+    cache._entries[0]["stored_at"] = time.time() - 120
+
+    assert cache.lookup(QUESTION, False, "m", "v1") is None
+    assert cache.get_stats()["entries"] == 0
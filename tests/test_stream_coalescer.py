@@ -0,0 +1,29 @@
+import time
+
+from utils.stream_coalescer import DeltaCoalescer
+
+
+def test_fast_deltas_are_grouped():
+    coalescer = DeltaCoalescer(max_bytes=1024, max_delay_ms=1000)
+    frames = coalescer.push('content', 'a')
+    for text in 'bcd':
+        frames += coalescer.push('content', text)
+    frames += coalescer.flush()
+    assert [f['content'] for f in frames] == ['a', 'bcd']
+
+
+def test_pending_text_is_released_when_its_deadline_passes():
+    coalescer = DeltaCoalescer(max_bytes=1024, max_delay_ms=20)
+    coalescer.push('content', 'a')
+    assert coalescer.push('content', 'b') == []
+    assert coalescer.due() == []
+    time.sleep(0.03)
+    # chunk do upstream sem delta (ex.: texto retido pelo parser)
+    assert coalescer.due() == [{"type": "content", "content": "b"}]
+
+
+def test_slow_deltas_are_not_held():
+    coalescer = DeltaCoalescer(max_bytes=1024, max_delay_ms=20)
+    coalescer.push('content', 'a')
+    time.sleep(0.03)
+    assert coalescer.push('content', 'b') == [{"type": "content", "content": "b"}]
@@ -0,0 +1,51 @@
+import threading
+import time
+
+from utils.tool_executor import ToolExecutor
+
+
+def test_memory_tools_run_in_order_and_reads_in_parallel():
+    executor = ToolExecutor(max_workers=4, default_timeout=2, parallel_tools=('search_web_comprehensive',))
+    log = []
+    lock = threading.Lock()
+    store = {}
+
+    def step(name, func, delay):
+        def run():
+            with lock:
+                log.append(('start', name))
+            time.sleep(delay)
+            resultado = func()
+            with lock:
+                log.append(('end', name))
+            return resultado
+        return run
+
+    calls = [
+        ('salvar_dados', step('salvar', lambda: store.update(x=1) or {'status': 'sucesso'}, 0.1)),
+        ('search_web_comprehensive', step('busca', lambda: {'status': 'sucesso'}, 0.1)),
+        ('buscar_dados', step('buscar', lambda: {'status': 'sucesso', 'valor': store.get('x')}, 0)),
+        ('deletar_dados', step('deletar', lambda: store.pop('x') and {'status': 'sucesso'}, 0)),
+    ]
+    results = executor.run(calls)
+
+    assert results[2][0]['valor'] == 1
+    assert 'x' not in store
+    memory = [name for event, name in log if event == 'start' and name != 'busca']
+    assert memory == ['salvar', 'buscar', 'deletar']
+    # a busca começou antes de o salvar terminar
+    assert log.index(('start', 'busca')) < log.index(('end', 'salvar'))
+
+
+def test_queue_stops_after_a_timed_out_memory_tool():
+    executor = ToolExecutor(max_workers=2, default_timeout=0.1)
+    ran = []
+    calls = [
+        ('salvar_dados', lambda: time.sleep(0.3) or {'status': 'sucesso'}),
+        ('deletar_dados', lambda: ran.append('deletar') or {'status': 'sucesso'}),
+    ]
+    results = executor.run(calls)
+    time.sleep(0.4)
+
+    assert [r[0]['status'] for r in results] == ['erro', 'erro']
+    assert ran == []
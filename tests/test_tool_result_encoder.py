@@ -0,0 +1,34 @@
+import json
+
+from utils.tool_result_encoder import ToolResultEncoder
+
+
+def test_empty_memory_lookup_keeps_its_meaning():
+    encoder = ToolResultEncoder()
+    text, _ = encoder.encode('buscar_dados', {
+        'status': 'sucesso', 'total_encontrados': 0, 'dados': [], 'session_id': 'abcd1234...'
+    })
+    assert json.loads(text) == {'total_encontrados': 0, 'dados': []}
+
+
+def test_memory_lookup_keeps_only_what_the_model_uses():
+    encoder = ToolResultEncoder()
+    text, _ = encoder.encode('buscar_dados', {
+        'status': 'sucesso', 'total_encontrados': 1, 'session_id': 'abcd1234...',
+        'dados': [{'chave': 'nome', 'valor': 'Ana', 'categoria': 'pessoal', 'criado_em': '2026-01-01'}]
+    })
+    assert json.loads(text) == {
+        'total_encontrados': 1, 'dados': [{'chave': 'nome', 'valor': 'Ana', 'categoria': 'pessoal'}]
+    }
+
+
+def test_error_and_oversized_results_stay_valid_json():
+    encoder = ToolResultEncoder(token_budget=50)
+    error, _ = encoder.encode('buscar_dados', {'status': 'erro', 'mensagem': 'falhou'})
+    assert json.loads(error) == {'erro': 'falhou'}
+
+    big = {'status': 'sucesso', 'query': 'x', 'resultados': [
+        {'titulo': f't{i}', 'conteudo': 'y' * 500, 'fonte': 'f', 'url': 'u'} for i in range(10)
+    ]}
+    text, saved = encoder.encode('search_web_comprehensive', big)
+    assert json.loads(text)['resultados'] and saved > 0
@@ -0,0 +1,41 @@
+import time
+
+from tools import web_search
+
+
+def test_slow_source_is_reported_late_without_blocking_the_deadline(monkeypatch):
+    def fast(query, timeout):
+        return {"status": "sucesso", "resultados": [
+            {"titulo": "Resultado rápido", "conteudo": "texto", "fonte": "Rápida", "url": ""}
+        ]}
+
+    def slow(query, timeout):
+        time.sleep(1.5)
+        return {"status": "sucesso", "resultados": []}
+
+    monkeypatch.setattr(web_search, 'SEARCH_SOURCES', [('Rápida', fast), ('Lenta', slow)])
+
+    start = time.monotonic()
+    resultado = web_search._search_all_sources("consulta de teste", deadline=0.3)
+    elapsed = time.monotonic() - start
+
+    assert elapsed < 1.0
+    assert resultado["status"] == "sucesso"
+    assert resultado["fontes_usadas"] == ["Rápida"]
+    assert resultado["fontes_atrasadas"] == ["Lenta"]
+
+
+def test_failing_source_does_not_hide_the_others(monkeypatch):
+    def broken(query, timeout):
+        raise ConnectionError("fora do ar")
+
+    def fast(query, timeout):
+        return {"status": "sucesso", "resultados": [
+            {"titulo": "Outro resultado", "conteudo": "texto", "fonte": "Rápida", "url": ""}
+        ]}
+
+    monkeypatch.setattr(web_search, 'SEARCH_SOURCES', [('Quebrada', broken), ('Rápida', fast)])
+
+    resultado = web_search._search_all_sources("outra consulta", deadline=1)
+    assert resultado["fontes_usadas"] == ["Rápida"]
+    assert "fontes_atrasadas" not in resultado
@@ -1696,6 +1696,17 @@ async function processStreamResponse(response, container) {
                             }
                         }
                         
+                        if (data.type === 'blocked') {
+                            // Filtro de segurança cortou a resposta: descartar o parcial já exibido
+                            fullContent = '';
+                            const contentDiv = container.querySelector('.streaming-content');
+                            if (contentDiv) {
+                                contentDiv.textContent = data.error;
+                            }
+                            reader.cancel();
+                            return;
+                        }
+
                         if (data.type === 'thinking_done' && data.thinking) {
                             thinkingContent = data.thinking;
                             console.log('🧠 [STREAM] Thinking recebido:', thinkingContent.length, 'chars');
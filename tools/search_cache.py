@@ -0,0 +1,258 @@
+"""
+Cache de resultados da busca web: LRU em memória + SQLite, com TTL por tipo de consulta
+"""
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from config import (SEARCH_CACHE_ENABLED, SEARCH_CACHE_FILE, SEARCH_CACHE_MEMORY_ENTRIES,
+                    SEARCH_CACHE_TTLS, SEARCH_CACHE_STALE_FOR)
+
+_WORD = re.compile(r'[a-z0-9]+')
+
+# Palavras que não mudam o que se busca ("o preço do dólar" == "preço dólar")
+STOPWORDS = frozenset((
+    'a', 'o', 'as', 'os', 'um', 'uma', 'uns', 'umas', 'de', 'do', 'da', 'dos', 'das', 'em', 'no', 'na',
+    'nos', 'nas', 'por', 'para', 'pra', 'pro', 'com', 'e', 'ou', 'que', 'se', 'sobre', 'me', 'ao', 'aos',
+    'the', 'of', 'and', 'or', 'in', 'on', 'for', 'to', 'is', 'an',
+))
+
+# Notícias, cotações, placares: mudam em minutos
+NEWS_WORDS = frozenset((
+    'noticia', 'noticias', 'hoje', 'agora', 'ontem', 'ultimas', 'placar', 'jogo', 'resultado',
+    'cotacao', 'dolar', 'euro', 'bitcoin', 'preco', 'precos', 'eleicao', 'eleicoes', 'vivo',
+    'previsao', 'lancamento', 'news', 'today', 'latest', 'price',
+))
+
+# Consultas de enciclopédia: a resposta praticamente não muda
+ENCYCLOPEDIC_PREFIXES = ('o que e', 'o que sao', 'quem foi', 'como funciona', 'significado',
+                         'definicao', 'historia', 'what is', 'who was')
+
+# Cargos e "atual": a resposta muda com quem ocupa o posto ("o que faz o atual presidente do BC")
+CURRENT_ROLE_WORDS = frozenset((
+    'presidente', 'ministro', 'ministra', 'governador', 'governadora', 'prefeito', 'prefeita', 'senador',
+    'deputado', 'papa', 'rei', 'rainha', 'ceo', 'diretor', 'tecnico', 'treinador', 'campeao', 'lider',
+    'dono', 'atual', 'atualmente', 'president', 'minister', 'current', 'currently', 'champion',
+))
+
+# A cada quantas gravações as linhas vencidas saem do SQLite
+PRUNE_EVERY = 200
+
+
+def _fold(text):
+    """Minúsculo, sem acentos, só palavras"""
+    text = unicodedata.normalize('NFKD', (text or '').casefold())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return _WORD.findall(text)
+
+
+def normalize_query(query):
+    """'  O Preço do DÓLAR hoje ' -> 'preco dolar hoje'"""
+    words = _fold(query)
+    return ' '.join(w for w in words if w not in STOPWORDS) or ' '.join(words)
+
+
+def classify_query(query):
+    """Classe de frescor da consulta: 'news', 'temporal', 'encyclopedic' ou 'default'"""
+    from tools.web_search import is_temporal_query  # web_search importa este módulo
+
+    words = _fold(query)
+    if NEWS_WORDS.intersection(words):
+        return 'news'
+    if is_temporal_query(query):
+        return 'temporal'
+    if CURRENT_ROLE_WORDS.intersection(words):
+        return 'default'
+    if ' '.join(words).startswith(ENCYCLOPEDIC_PREFIXES):
+        return 'encyclopedic'
+    return 'default'
+
+
+class SearchCache:
+    """Resultados de busca em dois níveis: LRU em memória na frente de um SQLite.
+
+    A chave é a consulta normalizada (caixa, acentos, espaços e stopwords),
+    então "Preço do dólar hoje" e "preco dolar  hoje" são a mesma busca. O
+    TTL vem da classe da consulta no momento da gravação (`SEARCH_CACHE_TTLS`):
+    minutos para notícias e cotações, uma hora para perguntas com datas, dias
+    para definições. Depois do TTL a entrada ainda é servida enquanto uma
+    thread refaz a busca (stale-while-revalidate) por uma janela do mesmo
+    tamanho do TTL, limitada a `stale_for`: uma cotação de 15 minutos nunca
+    sai com mais de 30. Só uma atualização por chave roda por vez. O arquivo do
+    SQLite só é criado na primeira gravação.
+    """
+
+    def __init__(self, db_file, memory_entries=500, ttls=None, stale_for=24 * 3600):
+        self.db_file = db_file
+        self.memory_entries = memory_entries
+        self.ttls = dict(ttls or {'default': 6 * 3600})
+        self.stale_for = stale_for
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._refreshing = set()
+        self._puts = 0
+        self._db_ready = False
+        self._stats = {'hits_memory': 0, 'hits_disk': 0, 'stale_served': 0, 'misses': 0, 'stores': 0,
+                       'refreshes': 0, 'refresh_failures': 0, 'disk_errors': 0}
+        print(f" SearchCache inicializado - {memory_entries} consultas em memória, SQLite em {db_file}")
+
+    def _connect(self):
+        """Conexão com o SQLite; cria o arquivo e a tabela no primeiro uso"""
+        conn = sqlite3.connect(self.db_file, timeout=5)
+        if not self._db_ready:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS search_cache (
+                    chave TEXT PRIMARY KEY,
+                    resultado TEXT NOT NULL,
+                    stored_at REAL NOT NULL,
+                    ttl REAL NOT NULL
+                )
+            """)
+            conn.commit()
+            self._db_ready = True
+        return conn
+
+    def stale_window(self, ttl):
+        """Quanto tempo depois do TTL a entrada ainda é servida (atualizando em segundo plano)"""
+        return min(ttl, self.stale_for)
+
+    def ttl_for(self, query):
+        return self.ttls.get(classify_query(query), self.ttls['default'])
+
+    def get(self, query):
+        """(resultado, fresco) ou (None, False); o resultado é uma cópia"""
+        key = normalize_query(query)
+        if not key:
+            return None, False
+
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+        source = 'hits_memory'
+
+        if entry is None:
+            entry = self._load(key)
+            source = 'hits_disk'
+            if entry is not None:
+                self._remember(key, entry)
+
+        age = time.time() - entry['stored_at'] if entry else None
+        with self._lock:
+            if entry is None or age > entry['ttl'] + self.stale_window(entry['ttl']):
+                self._stats['misses'] += 1
+                return None, False
+            self._stats[source] += 1
+            fresh = age <= entry['ttl']
+            if not fresh:
+                self._stats['stale_served'] += 1
+
+        resultado = dict(entry['resultado'], query=query)
+        return resultado, fresh
+
+    def put(self, query, resultado, ttl=None):
+        key = normalize_query(query)
+        if not key or resultado.get('status') != 'sucesso':
+            return
+        ttl = ttl or self.ttl_for(query)
+        if resultado.get('fontes_atrasadas'):
+            # Resultado parcial (fonte estourou o prazo): vale por pouco tempo
+            ttl = min(ttl, self.ttls.get('news', ttl))
+        entry = {'resultado': resultado, 'stored_at': time.time(), 'ttl': ttl}
+        self._remember(key, entry)
+
+        try:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO search_cache (chave, resultado, stored_at, ttl) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(resultado, ensure_ascii=False), entry['stored_at'], entry['ttl'])
+            )
+            with self._lock:
+                self._puts += 1
+                self._stats['stores'] += 1
+                prune = self._puts % PRUNE_EVERY == 0
+            if prune:
+                conn.execute("DELETE FROM search_cache WHERE stored_at + ttl + MIN(ttl, ?) < ?",
+                             (self.stale_for, time.time()))
+            conn.commit()
+            conn.close()
+        except sqlite3.Error as e:
+            with self._lock:
+                self._stats['disk_errors'] += 1
+            print(f" [SEARCH CACHE] Erro ao gravar no SQLite: {e}")
+
+    def refresh(self, query, search):
+        """Refaz a busca numa thread (uma por chave) e grava se der certo"""
+        key = normalize_query(query)
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            self._stats['refreshes'] += 1
+
+        def run():
+            try:
+                resultado = search()
+                if resultado.get('status') == 'sucesso':
+                    self.put(query, resultado)
+                else:
+                    with self._lock:
+                        self._stats['refresh_failures'] += 1
+            except Exception as e:
+                with self._lock:
+                    self._stats['refresh_failures'] += 1
+                print(f" [SEARCH CACHE] Falha ao atualizar '{query[:40]}': {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=run, daemon=True, name="search-refresh").start()
+
+    def _remember(self, key, entry):
+        with self._lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _load(self, key):
+        if not self._db_ready and not os.path.exists(self.db_file):
+            return None
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT resultado, stored_at, ttl FROM search_cache WHERE chave = ?", (key,)
+            ).fetchone()
+            conn.close()
+        except sqlite3.Error as e:
+            with self._lock:
+                self._stats['disk_errors'] += 1
+            print(f" [SEARCH CACHE] Erro ao ler do SQLite: {e}")
+            return None
+        if row is None:
+            return None
+        return {'resultado': json.loads(row[0]), 'stored_at': row[1], 'ttl': row[2]}
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            hits = stats['hits_memory'] + stats['hits_disk']
+            lookups = hits + stats['misses']
+            stats['hit_ratio'] = round(hits / lookups * 100, 1) if lookups else 0
+            stats['memory_entries'] = len(self._memory)
+            stats['refreshing'] = len(self._refreshing)
+            stats['ttls'] = dict(self.ttls)
+            return stats
+
+
+search_cache = SearchCache(
+    SEARCH_CACHE_FILE,
+    memory_entries=SEARCH_CACHE_MEMORY_ENTRIES,
+    ttls=SEARCH_CACHE_TTLS,
+    stale_for=SEARCH_CACHE_STALE_FOR
+) if SEARCH_CACHE_ENABLED else None
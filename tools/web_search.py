@@ -4,7 +4,19 @@ import json
 import re
 from urllib.parse import quote
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from html import unescape
+from config import WEB_SEARCH_DEADLINE, WEB_SEARCH_MAX_WORKERS, WIKIPEDIA_API_URL
+from tools.search_cache import search_cache
+
+# Palavras que indicam pergunta sensível a datas/sequência temporal
+TEMPORAL_WORDS = ('primeiro', 'último', 'quando', 'data', 'ano', 'antes', 'depois', 'após')
+
+def is_temporal_query(query):
+    """Se a busca envolve datas ou ordem cronológica"""
+    query_lower = (query or '').lower()
+    return any(word in query_lower for word in TEMPORAL_WORDS)
 
 def clean_text(text):
     """Limpa e formata texto de forma eficiente"""
@@ -29,7 +41,7 @@ def clean_text(text):
     
     return text
 
-def search_duckduckgo_working(query):
+def search_duckduckgo_working(query, timeout=10):
     """✅ DuckDuckGo usando biblioteca que FUNCIONA"""
     try:
         print(f"🦆 DuckDuckGo (biblioteca): '{query}'")
@@ -45,7 +57,7 @@ def search_duckduckgo_working(query):
         
         # Fazer a busca
         results = []
-        with DDGS() as ddgs:
+        with DDGS(timeout=timeout) as ddgs:
             search_results = list(ddgs.text(query, max_results=5, safesearch='moderate'))
         
         for item in search_results:
@@ -73,13 +85,16 @@ def search_duckduckgo_working(query):
         print(f"❌ DuckDuckGo: {str(e)}")
         return {"status": "erro", "mensagem": f"Erro DuckDuckGo: {str(e)}"}
 
-def search_wikipedia_working(query):
-    """✅ Wikipedia API - 100% funcional e confiável"""
+WIKIPEDIA_LANG_LABELS = {'pt': 'Wikipedia', 'en': 'Wikipedia (EN)'}
+
+def search_wikipedia_lang(query, lang='pt', timeout=10):
+    """📚 Wikipedia API (Wikimedia) em um idioma"""
+    fonte = WIKIPEDIA_LANG_LABELS.get(lang, f'Wikipedia ({lang.upper()})')
     try:
-        print(f"📚 Wikipedia: '{query}'")
+        print(f"📚 {fonte}: '{query}'")
         
         # API da Wikimedia (oficial e gratuita)
-        url = "https://api.wikimedia.org/core/v1/wikipedia/pt/search/page"
+        url = f"{WIKIPEDIA_API_URL}/{lang}/search/page"
         params = {
             'q': query,
             'limit': 5
@@ -88,7 +103,7 @@ def search_wikipedia_working(query):
             'User-Agent': 'TitanBot/1.0 (contato@exemplo.com)'
         }
         
-        response = requests.get(url, params=params, headers=headers, timeout=10)
+        response = requests.get(url, params=params, headers=headers, timeout=timeout)
         data = response.json()
         
         results = []
@@ -102,48 +117,132 @@ def search_wikipedia_working(query):
                 results.append({
                     'titulo': titulo,
                     'conteudo': conteudo,
-                    'fonte': 'Wikipedia',
-                    'url': f"https://pt.wikipedia.org/wiki/{key}",
+                    'fonte': fonte,
+                    'url': f"https://{lang}.wikipedia.org/wiki/{key}",
                     'tipo': 'conhecimento',
                     'relevancia': 'alta'
                 })
         
-        # Tentar em inglês se não achou em português
-        if not results:
-            print("🔄 Tentando Wikipedia em inglês...")
-            url = "https://api.wikimedia.org/core/v1/wikipedia/en/search/page"
-            response = requests.get(url, params=params, headers=headers, timeout=10)
-            data = response.json()
-            
-            for page in data.get('pages', []):
-                titulo = clean_text(page.get('title', ''))
-                descricao = page.get('description') or page.get('excerpt', 'Wikipedia article')
-                conteudo = clean_text(descricao)
-                key = page.get('key', '')
-                
-                if titulo:
-                    results.append({
-                        'titulo': titulo,
-                        'conteudo': conteudo,
-                        'fonte': 'Wikipedia (EN)',
-                        'url': f"https://en.wikipedia.org/wiki/{key}",
-                        'tipo': 'conhecimento',
-                        'relevancia': 'alta'
-                    })
-        
         if results:
-            print(f"✅ Wikipedia: {len(results)} resultados")
+            print(f"✅ {fonte}: {len(results)} resultados")
             return {"status": "sucesso", "resultados": results}
         else:
-            return {"status": "erro", "mensagem": "Sem resultados na Wikipedia"}
+            return {"status": "erro", "mensagem": f"Sem resultados na {fonte}"}
             
     except Exception as e:
-        print(f"❌ Wikipedia: {str(e)}")
-        return {"status": "erro", "mensagem": f"Erro Wikipedia: {str(e)}"}
+        print(f"❌ {fonte}: {str(e)}")
+        return {"status": "erro", "mensagem": f"Erro {fonte}: {str(e)}"}
+
+# Fontes consultadas em paralelo: (nome, função(query, timeout)), na ordem de prioridade
+SEARCH_SOURCES = [
+    ('DuckDuckGo', search_duckduckgo_working),
+    ('Wikipedia', lambda query, timeout: search_wikipedia_lang(query, 'pt', timeout)),
+    ('Wikipedia (EN)', lambda query, timeout: search_wikipedia_lang(query, 'en', timeout)),
+]
+
+# Só usada quando a Wikipedia em português não trouxe nada
+FALLBACK_SOURCES = {'Wikipedia (EN)': 'Wikipedia'}
+
+_search_pool = ThreadPoolExecutor(max_workers=WEB_SEARCH_MAX_WORKERS, thread_name_prefix="web-search")
 
-def search_web_comprehensive(query):
-    """🌐 BUSCA ROBUSTA - Combinando fontes que REALMENTE funcionam"""
+class SearchSourceStats:
+    """Latência e taxa de sucesso de cada fonte da busca"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sources = {}
+        self._searches = {'total': 0, 'partial': 0}
+    
+    def record(self, fonte, status, elapsed_ms):
+        """status: 'sucesso', 'erro' ou 'timeout'"""
+        with self._lock:
+            stats = self._sources.setdefault(fonte, {'calls': 0, 'sucesso': 0, 'erro': 0, 'timeout': 0, 'total_ms': 0.0})
+            stats['calls'] += 1
+            stats[status] += 1
+            stats['total_ms'] += elapsed_ms
+    
+    def record_search(self, partial):
+        with self._lock:
+            self._searches['total'] += 1
+            if partial:
+                self._searches['partial'] += 1
+    
+    def get_stats(self):
+        with self._lock:
+            return dict(
+                self._searches,
+                deadline_s=WEB_SEARCH_DEADLINE,
+                fontes={
+                    fonte: {
+                        'calls': s['calls'],
+                        'success_rate': round(s['sucesso'] / s['calls'] * 100, 1),
+                        'errors': s['erro'],
+                        'timeouts': s['timeout'],
+                        'avg_ms': round(s['total_ms'] / s['calls'], 1)
+                    }
+                    for fonte, s in self._sources.items()
+                }
+            )
+
+search_source_stats = SearchSourceStats()
+
+def _fan_out(query, deadline):
+    """Consulta todas as fontes ao mesmo tempo até `deadline` segundos.
+    
+    Devolve {fonte: resultado} das que responderam e a lista das atrasadas.
+    Cada fonte recebe o próprio prazo como timeout HTTP, então uma atrasada
+    termina sozinha logo depois; as que ainda nem começaram (pool cheio)
+    são canceladas, e o que chegar depois do prazo é descartado.
+    """
+    start = time.monotonic()
+    futures = {}
+    for fonte, func in SEARCH_SOURCES:
+        futures[_search_pool.submit(_timed_source, func, query, deadline)] = fonte
+    
+    respostas = {}
+    done, pending = wait(futures, timeout=deadline)
+    for future in done:
+        fonte = futures[future]
+        try:
+            resultado, elapsed_ms = future.result()
+        except Exception as e:
+            resultado, elapsed_ms = {"status": "erro", "mensagem": str(e)}, (time.monotonic() - start) * 1000
+        search_source_stats.record(fonte, 'sucesso' if resultado.get('status') == 'sucesso' else 'erro', elapsed_ms)
+        respostas[fonte] = resultado
+    
+    atrasadas = []
+    for future in pending:
+        future.cancel()
+        fonte = futures[future]
+        search_source_stats.record(fonte, 'timeout', deadline * 1000)
+        atrasadas.append(fonte)
+    return respostas, atrasadas
+
+def _timed_source(func, query, timeout):
+    start = time.monotonic()
+    resultado = func(query, timeout)
+    return resultado, (time.monotonic() - start) * 1000
+
+def search_web_comprehensive(query, deadline=None):
+    """🌐 BUSCA COM CACHE - Resultado recente reaproveitado; vencido é servido enquanto atualiza"""
+    if search_cache is None:
+        return _search_all_sources(query, deadline)
+    
+    cached, fresh = search_cache.get(query)
+    if cached:
+        print(f"💾 Busca em cache ({'fresca' if fresh else 'vencida, atualizando'}): '{query}'")
+        if not fresh:
+            search_cache.refresh(query, lambda: _search_all_sources(query, deadline))
+        return cached
+    
+    resultado = _search_all_sources(query, deadline)
+    search_cache.put(query, resultado)
+    return resultado
+
+def _search_all_sources(query, deadline=None):
+    """🌐 BUSCA ROBUSTA - Todas as fontes em paralelo, com prazo global"""
     try:
+        deadline = deadline or WEB_SEARCH_DEADLINE
         print(f"\n🔍 BUSCA INICIADA: '{query}'")
         print("=" * 60)
         
@@ -151,29 +250,23 @@ def search_web_comprehensive(query):
         fontes_usadas = []
         fontes_com_erro = []
         
-        # === ESTRATÉGIA: Fontes que funcionam ===
+        # === ESTRATÉGIA: DuckDuckGo e Wikipedia (PT e EN) ao mesmo tempo ===
+        respostas, atrasadas = _fan_out(query, deadline)
+        search_source_stats.record_search(partial=bool(atrasadas))
         
-        # 1. DuckDuckGo via biblioteca (melhor opção)
-        try:
-            ddg_result = search_duckduckgo_working(query)
-            if ddg_result['status'] == 'sucesso':
-                todos_resultados.extend(ddg_result['resultados'])
-                fontes_usadas.append('DuckDuckGo')
+        for fonte, _ in SEARCH_SOURCES:
+            if fonte in atrasadas:
+                fontes_com_erro.append(f"{fonte}: sem resposta em {deadline}s")
+                continue
+            resultado = respostas[fonte]
+            principal = FALLBACK_SOURCES.get(fonte)
+            if principal and respostas.get(principal, {}).get('status') == 'sucesso':
+                continue
+            if resultado['status'] == 'sucesso':
+                todos_resultados.extend(resultado['resultados'])
+                fontes_usadas.append(fonte)
             else:
-                fontes_com_erro.append("DuckDuckGo: " + ddg_result.get('mensagem', 'Falha'))
-        except Exception as e:
-            fontes_com_erro.append(f"DuckDuckGo: {str(e)}")
-        
-        # 2. Wikipedia (sempre funciona)
-        try:
-            wiki_result = search_wikipedia_working(query)
-            if wiki_result['status'] == 'sucesso':
-                todos_resultados.extend(wiki_result['resultados'])
-                fontes_usadas.append('Wikipedia')
-            else:
-                fontes_com_erro.append("Wikipedia: " + wiki_result.get('mensagem', 'Falha'))
-        except Exception as e:
-            fontes_com_erro.append(f"Wikipedia: {str(e)}")
+                fontes_com_erro.append(f"{fonte}: " + resultado.get('mensagem', 'Falha'))
         
         # === PROCESSAR RESULTADOS ===
         
@@ -197,7 +290,7 @@ def search_web_comprehensive(query):
             print(f"   🎯 {len(fontes_usadas)} fontes: {', '.join(fontes_usadas)}")
             print("=" * 60)
             
-            return {
+            resultado = {
                 "status": "sucesso",
                 "query": query,
                 "total_resultados": len(resultados_limpos),
@@ -205,6 +298,9 @@ def search_web_comprehensive(query):
                 "resultados": resultados_limpos,
                 "resumo": f"Encontrei {len(resultados_limpos)} resultados de {len(fontes_usadas)} fontes confiáveis"
             }
+            if atrasadas:
+                resultado["fontes_atrasadas"] = atrasadas
+            return resultado
         else:
             print(f"\n❌ BUSCA SEM RESULTADOS:")
             print(f"   🔍 Query: {query}")
@@ -247,8 +343,7 @@ def format_search_results(search_data):
     formatted += f"✅ **{search_data['resumo']}**\n\n"
     
     # Aviso especial para questões temporais
-    query_lower = search_data['query'].lower()
-    if any(word in query_lower for word in ['primeiro', 'último', 'quando', 'data', 'ano', 'antes', 'depois', 'após']):
+    if is_temporal_query(search_data['query']):
         formatted += "⚠️ **ATENÇÃO CRONOLÓGICA:** Verifique cuidadosamente datas e sequências temporais!\n\n"
     
     # Resultados organizados
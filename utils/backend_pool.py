@@ -0,0 +1,221 @@
+"""
+Pool de backends Ollama com balanceamento por menor número de requests em andamento
+"""
+import threading
+import time
+
+from utils.ollama_transport import OllamaTransport
+from utils.health_monitor import OllamaHealthMonitor, STATUS_UP, STATUS_DEGRADED, STATUS_DOWN, STATUS_UNKNOWN
+
+# Tempo que um modelo continua "quente" num backend depois de servir uma geração
+RECENT_MODEL_TTL = 300
+
+# Backend que nem tem o modelo baixado só é usado em último caso
+MISSING_MODEL_PENALTY = 1000
+
+# Vantagem (em streams equivalentes) do backend que atendeu o turno anterior da sessão
+SESSION_AFFINITY_BONUS = 1
+
+
+class OllamaBackend:
+    """Uma instância do Ollama: transporte próprio, monitor de saúde e métricas"""
+
+    def __init__(self, host_url, pool_size, connect_timeout, endpoint_timeouts,
+                 health_interval, health_max_backoff):
+        self.url = host_url.rstrip('/')
+        self.transport = OllamaTransport(
+            self.url,
+            pool_size=pool_size,
+            connect_timeout=connect_timeout,
+            endpoint_timeouts=endpoint_timeouts
+        )
+        self.health = OllamaHealthMonitor(
+            self.transport,
+            interval=health_interval,
+            max_backoff=health_max_backoff,
+            name=self.url
+        )
+
+        # Protegidos pelo lock do BackendPool
+        self.in_flight = 0
+        self.completed = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.ejected_until = 0.0
+        self.total_latency = 0.0
+        self.total_output_chars = 0
+        self.recent_models = {}
+
+    def is_ejected(self, now):
+        return now < self.ejected_until
+
+    def is_eligible(self, now):
+        return not self.is_ejected(now) and self.health.is_available()
+
+    def has_loaded(self, model, now):
+        served_at = self.recent_models.get(model)
+        if served_at and now - served_at < RECENT_MODEL_TTL:
+            return True
+        return self.health.has_loaded(model)
+
+    def avg_latency_ms(self):
+        return (self.total_latency / self.completed) * 1000 if self.completed else 0.0
+
+    def snapshot(self, now):
+        health = self.health.get_state()
+        return {
+            'url': self.url,
+            'status': health['status'],
+            'ejected': self.is_ejected(now),
+            'in_flight': self.in_flight,
+            'completed': self.completed,
+            'errors': self.errors,
+            'avg_latency_ms': round(self.avg_latency_ms(), 1),
+            'throughput_chars_s': round(self.total_output_chars / self.total_latency, 1) if self.total_latency else 0,
+            'probe_latency_ms': health['latency_ms'],
+            'loaded_models': health['loaded_models'],
+            'transport': self.transport.get_stats()
+        }
+
+
+class BackendLease:
+    """Reserva de um backend para uma geração; liberar exatamente uma vez"""
+
+    def __init__(self, pool, backend):
+        self.pool = pool
+        self.backend = backend
+        self.started = time.time()
+        self._released = False
+
+    @property
+    def transport(self):
+        return self.backend.transport
+
+    def release(self, error=False, output_chars=0, model=None, record=True):
+        """`record=False`: só devolve a vaga, sem contar erro nem latência (ex.: embeddings)"""
+        if self._released:
+            return
+        self._released = True
+        self.pool._release(self.backend, time.time() - self.started, error, output_chars, model, record)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release(error=exc_type is not None)
+        return False
+
+
+class BackendPool:
+    """Roteia cada geração para o backend elegível com menos streams em andamento.
+
+    Backends sem o modelo carregado recebem uma penalidade de `load_penalty`
+    streams (carregar o modelo custa caro), e os que nem têm o modelo baixado
+    só são usados em último caso. Backends que falham
+    `eject_after` vezes seguidas ficam fora por `eject_cooldown` segundos e
+    voltam quando o cooldown acaba e o monitor de saúde os vê no ar.
+    """
+
+    def __init__(self, urls, pool_size=10, connect_timeout=5, endpoint_timeouts=None,
+                 health_interval=15, health_max_backoff=120, eject_after=3, eject_cooldown=30,
+                 load_penalty=2):
+        if not urls:
+            raise ValueError("Pelo menos um backend Ollama é obrigatório")
+
+        self.backends = [
+            OllamaBackend(url, pool_size, connect_timeout, endpoint_timeouts,
+                          health_interval, health_max_backoff)
+            for url in urls
+        ]
+        self.eject_after = eject_after
+        self.eject_cooldown = eject_cooldown
+        self.load_penalty = load_penalty
+        self._lock = threading.Lock()
+        self._rr = 0
+        print(f" BackendPool inicializado - {len(self.backends)} backend(s): {', '.join(b.url for b in self.backends)}")
+
+    def start(self):
+        for backend in self.backends:
+            backend.health.start()
+
+    def acquire(self, model, prefer=None):
+        """Escolhe um backend e reserva uma vaga nele (`prefer`: url com afinidade)"""
+        with self._lock:
+            now = time.time()
+            eligible = [b for b in self.backends if b.is_eligible(now)]
+            if not eligible:
+                # Todos fora: tentar mesmo assim em vez de recusar a geração
+                eligible = [b for b in self.backends if not b.is_ejected(now)] or list(self.backends)
+
+            # Rotacionar para desempatar em round-robin
+            self._rr = (self._rr + 1) % len(eligible)
+            rotated = eligible[self._rr:] + eligible[:self._rr]
+            backend = min(rotated, key=lambda b: b.in_flight + self._cold_penalty(b, model, now)
+                          - (SESSION_AFFINITY_BONUS if b.url == prefer else 0))
+            backend.in_flight += 1
+
+        return BackendLease(self, backend)
+
+    def _cold_penalty(self, backend, model, now):
+        """Custo extra (em streams equivalentes) de usar um backend sem o modelo carregado"""
+        if backend.has_loaded(model, now):
+            return 0
+        if backend.health.has_model(model) or not backend.health.get_state()['models']:
+            return self.load_penalty
+        return MISSING_MODEL_PENALTY
+
+    def _release(self, backend, elapsed, error, output_chars, model, record=True):
+        with self._lock:
+            backend.in_flight = max(backend.in_flight - 1, 0)
+            if not record:
+                if model:
+                    backend.recent_models[model] = time.time()
+                return
+            if error:
+                backend.errors += 1
+                backend.consecutive_errors += 1
+                if backend.consecutive_errors >= self.eject_after and not backend.is_ejected(time.time()):
+                    backend.ejected_until = time.time() + self.eject_cooldown
+                    print(f" [BACKENDS] {backend.url} ejetado por {self.eject_cooldown}s "
+                          f"({backend.consecutive_errors} erros seguidos)")
+                # Confirmar o estado real sem esperar o próximo intervalo
+                backend.health.probe_now()
+                return
+
+            if backend.consecutive_errors and backend.ejected_until:
+                print(f" [BACKENDS] {backend.url} reintegrado ao pool")
+            backend.consecutive_errors = 0
+            backend.ejected_until = 0.0
+            backend.completed += 1
+            backend.total_latency += elapsed
+            backend.total_output_chars += output_chars
+            if model:
+                backend.recent_models[model] = time.time()
+
+    def get_health_state(self):
+        """Estado agregado: no ar se qualquer backend estiver no ar"""
+        states = [b.health.get_state() for b in self.backends]
+        statuses = {state['status'] for state in states}
+        for status in (STATUS_UP, STATUS_UNKNOWN, STATUS_DEGRADED):
+            if status in statuses:
+                break
+        else:
+            status = STATUS_DOWN
+
+        return {
+            'status': status,
+            'backends_up': sum(1 for state in states if state['status'] == STATUS_UP),
+            'backends_total': len(states),
+            'backends': {b.url: state for b, state in zip(self.backends, states)}
+        }
+
+    def get_transitions(self):
+        transitions = []
+        for backend in self.backends:
+            transitions.extend(dict(t, backend=backend.url) for t in backend.health.get_transitions())
+        return sorted(transitions, key=lambda t: t['timestamp'])
+
+    def get_stats(self):
+        with self._lock:
+            now = time.time()
+            return [backend.snapshot(now) for backend in self.backends]
@@ -0,0 +1,136 @@
+"""
+Dimensionamento do num_ctx por request e truncamento determinístico
+"""
+import threading
+import time
+
+# Estimativa inicial (caracteres por token) até haver calibração do Ollama
+DEFAULT_CHARS_PER_TOKEN = 3.5
+
+# Amostras fora desta faixa vieram de prefill parcial (prefixo em cache) e são descartadas
+MIN_CHARS_PER_TOKEN = 1.5
+MAX_CHARS_PER_TOKEN = 6.0
+CALIBRATION_ALPHA = 0.2
+
+# Tokens do template de chat por mensagem (papel, delimitadores)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Folga para o erro da estimativa
+SAFETY_MARGIN = 1.1
+
+TRUNCATION_MARKER = "\n... [TRUNCADO]"
+
+
+class ContextBudget:
+    """Estima os tokens do prompt e escolhe o menor bucket de num_ctx que cabe.
+
+    A estimativa é uma razão caracteres/token por modelo, calibrada (média
+    móvel) com o prompt_eval_count real de cada geração. Trocar o num_ctx
+    obriga o Ollama a recarregar o modelo, então o bucket só diminui depois
+    de `shrink_after` segundos sem nenhum request precisar do maior. Prompts
+    que não cabem no maior bucket perdem primeiro as mensagens mais antigas
+    do histórico e, em último caso, o fim da mensagem atual.
+    """
+
+    def __init__(self, buckets=(2048, 4096, 8192), shrink_after=600):
+        self.buckets = tuple(sorted(buckets))
+        self.max_ctx = self.buckets[-1]
+        self.shrink_after = shrink_after
+        self._lock = threading.Lock()
+        self._ratio = {}
+        self._current = {}
+        self._stats = {
+            'requests': 0,
+            'calibrations': 0,
+            'truncated_requests': 0,
+            'dropped_messages': 0,
+            'by_bucket': {bucket: 0 for bucket in self.buckets}
+        }
+
+    def chars_per_token(self, model):
+        return self._ratio.get(model, DEFAULT_CHARS_PER_TOKEN)
+
+    def estimate(self, messages, model):
+        """Tokens estimados do prompt (conteúdo + overhead por mensagem)"""
+        chars = sum(len(m.get('content') or '') for m in messages)
+        return int(chars / self.chars_per_token(model)) + MESSAGE_OVERHEAD_TOKENS * len(messages)
+
+    def fit(self, messages, model, num_predict, extra_chars=0):
+        """Trunca se preciso e escolhe o num_ctx; devolve (messages, num_ctx, prompt_tokens).
+
+        `extra_chars` é texto do prompt fora das mensagens (definições de ferramentas).
+        """
+        reserved = int(extra_chars / self.chars_per_token(model))
+        messages, dropped = self._truncate(list(messages), model, self.prompt_limit(model, num_predict, extra_chars))
+        prompt_tokens = self.estimate(messages, model) + reserved
+        needed = int((prompt_tokens + num_predict) * SAFETY_MARGIN)
+        num_ctx = self._choose_bucket(model, needed)
+
+        with self._lock:
+            self._stats['requests'] += 1
+            self._stats['by_bucket'][num_ctx] += 1
+            if dropped:
+                self._stats['truncated_requests'] += 1
+                self._stats['dropped_messages'] += dropped
+        if dropped:
+            print(f" [CONTEXT] Prompt truncado: {dropped} mensagem(ns) antiga(s) removida(s)")
+        return messages, num_ctx, prompt_tokens
+
+    def prompt_limit(self, model, num_predict, extra_chars=0):
+        """Tokens de mensagens que cabem no maior bucket junto com a resposta"""
+        reserved = int(extra_chars / self.chars_per_token(model))
+        return int((self.max_ctx - num_predict) / SAFETY_MARGIN) - reserved
+
+    def observe(self, model, prompt_chars, prompt_eval_count):
+        """Calibra a razão caracteres/token com o prompt_eval_count do Ollama"""
+        if not prompt_eval_count or not prompt_chars:
+            return
+        observed = prompt_chars / prompt_eval_count
+        if not MIN_CHARS_PER_TOKEN <= observed <= MAX_CHARS_PER_TOKEN:
+            return
+        with self._lock:
+            current = self._ratio.get(model, DEFAULT_CHARS_PER_TOKEN)
+            self._ratio[model] = current + CALIBRATION_ALPHA * (observed - current)
+            self._stats['calibrations'] += 1
+
+    def _choose_bucket(self, model, needed):
+        bucket = next((b for b in self.buckets if b >= needed), self.max_ctx)
+        now = time.time()
+        with self._lock:
+            current = self._current.get(model)
+            if current and current['num_ctx'] > bucket and now - current['needed_at'] < self.shrink_after:
+                # Manter o bucket maior evita recarregar o modelo
+                return current['num_ctx']
+            if current and current['num_ctx'] == bucket:
+                current['needed_at'] = now
+            else:
+                self._current[model] = {'num_ctx': bucket, 'needed_at': now}
+        return bucket
+
+    def _truncate(self, messages, model, limit):
+        """Remove histórico antigo (preservando system e a mensagem atual) até caber"""
+        dropped = 0
+        while self.estimate(messages, model) > limit:
+            removable = [i for i, m in enumerate(messages[:-1]) if m.get('role') != 'system']
+            if not removable:
+                break
+            messages.pop(removable[0])
+            dropped += 1
+
+        overflow = self.estimate(messages, model) - limit
+        if overflow > 0 and messages:
+            last = dict(messages[-1])
+            content = last.get('content') or ''
+            keep = max(len(content) - int(overflow * self.chars_per_token(model)) - len(TRUNCATION_MARKER), 0)
+            last['content'] = content[:keep] + TRUNCATION_MARKER
+            messages[-1] = last
+        return messages, dropped
+
+    def get_stats(self):
+        with self._lock:
+            return dict(
+                self._stats,
+                by_bucket=dict(self._stats['by_bucket']),
+                chars_per_token={model: round(ratio, 2) for model, ratio in self._ratio.items()},
+                current_num_ctx={model: c['num_ctx'] for model, c in self._current.items()}
+            )
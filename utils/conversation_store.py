@@ -0,0 +1,184 @@
+"""
+Memória contextual das conversas com orçamento de tokens por sessão
+"""
+import threading
+from collections import OrderedDict, deque
+
+# Custo aproximado de cada mensagem guardada além do texto (dict + strings)
+MESSAGE_OVERHEAD_BYTES = 240
+
+
+class _Session:
+    __slots__ = ('messages', 'tokens', 'bytes', 'window', 'summary', 'folded', 'folded_tokens')
+
+    def __init__(self):
+        self.messages = deque()
+        self.tokens = 0
+        self.bytes = 0
+        self.window = ()
+        self.summary = ""
+        self.folded = []
+        self.folded_tokens = 0
+
+
+class ConversationStore:
+    """Histórico recente de cada sessão, limitado por tokens e não por mensagens.
+
+    Cada sessão guarda as mensagens mais recentes que cabem em
+    `token_budget`; a janela pronta (tupla de dicts) é remontada só quando a
+    sessão muda, então `get_window` é O(1). Sessões inteiras saem por LRU
+    quando o total passa de `max_bytes` ou `max_sessions`. As mensagens
+    devolvidas são compartilhadas: quem chama não deve alterá-las.
+
+    Com `on_overflow` definido, as mensagens que saem da janela ficam
+    guardadas para o resumo da sessão; ao juntar `fold_min_tokens` delas o
+    callback é chamado (fora do lock) para resumi-las em segundo plano.
+    """
+
+    def __init__(self, token_budget=1536, max_bytes=32 * 1024 * 1024, max_sessions=10000,
+                 chars_per_token=3.5):
+        self.token_budget = token_budget
+        self.max_bytes = max_bytes
+        self.max_sessions = max_sessions
+        self.chars_per_token = chars_per_token
+
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self._bytes = 0
+        self._messages = 0
+        self._evicted_sessions = 0
+        self._trimmed_messages = 0
+        self.on_overflow = None
+        self.fold_min_tokens = 256
+        print(f" ConversationStore inicializado - {token_budget} tokens por sessão, "
+              f"teto {max_bytes // (1024 * 1024)}MB")
+
+    def add_message(self, session_id, role, content):
+        if not session_id or not content:
+            return
+        message = {'role': role, 'content': content}
+        tokens = int(len(content) / self.chars_per_token) + 1
+        size = len(content.encode('utf-8')) + MESSAGE_OVERHEAD_BYTES
+
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = _Session()
+            self._sessions.move_to_end(session_id)
+
+            session.messages.append((message, tokens, size))
+            session.tokens += tokens
+            session.bytes += size
+            self._bytes += size
+            self._messages += 1
+
+            self._trim(session)
+            session.window = tuple(entry[0] for entry in session.messages)
+            self._evict()
+            ready_to_fold = self.on_overflow and session.folded_tokens >= self.fold_min_tokens
+
+        if ready_to_fold:
+            self.on_overflow(session_id)
+
+    def get_window(self, session_id):
+        """Janela atual da sessão (mais antiga primeiro)"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return ()
+            self._sessions.move_to_end(session_id)
+            return session.window
+
+    # Compatibilidade com a interface da SimpleTitanMemory
+    get_conversation = get_window
+
+    def get_summary(self, session_id):
+        """Resumo das partes antigas da conversa ('' se não houver)"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session.summary if session else ""
+
+    def peek_fold(self, session_id):
+        """Mensagens pendentes de resumo, sem retirá-las: (resumo atual, mensagens)"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or not session.folded:
+                return None, []
+            return session.summary, list(session.folded)
+
+    def commit_fold(self, session_id, summary, folded):
+        """Grava o resumo novo e só então retira as mensagens `folded` (vindas de
+        `peek_fold`) das pendentes; se o resumo falhar, elas continuam lá"""
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return False
+            taken = {id(m) for m in folded}
+            released = [m for m in session.folded if id(m) in taken]
+            session.folded = [m for m in session.folded if id(m) not in taken]
+            session.folded_tokens -= sum(int(len(m['content']) / self.chars_per_token) + 1 for m in released)
+            delta = (len(summary.encode('utf-8')) - len(session.summary.encode('utf-8'))
+                     - sum(len(m['content'].encode('utf-8')) + MESSAGE_OVERHEAD_BYTES for m in released))
+            session.summary = summary
+            session.bytes += delta
+            self._bytes += delta
+            return True
+
+    def clear(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            if session:
+                self._drop(session)
+
+    def _trim(self, session):
+        """Remove as mais antigas até caber no orçamento (a janela começa pelo usuário)"""
+        messages = session.messages
+        while len(messages) > 1 and (session.tokens > self.token_budget
+                                     or messages[0][0]['role'] != 'user'):
+            message, tokens, size = messages.popleft()
+            session.tokens -= tokens
+            self._messages -= 1
+            self._trimmed_messages += 1
+
+            if self.on_overflow:
+                # Continua contando no tamanho da sessão até ser resumida
+                session.folded.append(message)
+                session.folded_tokens += tokens
+                self._cap_folded(session)
+            else:
+                session.bytes -= size
+                self._bytes -= size
+
+    def _cap_folded(self, session):
+        """Se o resumo atrasar, descarta as pendentes mais antigas"""
+        while session.folded and session.folded_tokens > self.token_budget * 4:
+            message = session.folded.pop(0)
+            session.folded_tokens -= int(len(message['content']) / self.chars_per_token) + 1
+            size = len(message['content'].encode('utf-8')) + MESSAGE_OVERHEAD_BYTES
+            session.bytes -= size
+            self._bytes -= size
+
+    def _evict(self):
+        while self._sessions and (self._bytes > self.max_bytes or len(self._sessions) > self.max_sessions):
+            _, session = self._sessions.popitem(last=False)
+            self._drop(session)
+            self._evicted_sessions += 1
+
+    def _drop(self, session):
+        self._bytes -= session.bytes
+        self._messages -= len(session.messages)
+
+    def get_stats(self):
+        """Ocupação de memória e evicções"""
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'messages': self._messages,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'usage_percent': round(self._bytes / self.max_bytes * 100, 2) if self.max_bytes else 0,
+                'token_budget': self.token_budget,
+                'evicted_sessions': self._evicted_sessions,
+                'trimmed_messages': self._trimmed_messages,
+                'summarized_sessions': sum(1 for s in self._sessions.values() if s.summary)
+            }
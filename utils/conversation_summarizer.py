@@ -0,0 +1,167 @@
+"""
+Resumo contínuo das conversas longas em segundo plano
+"""
+import queue
+import threading
+import time
+
+from models.generation_scheduler import generation_scheduler, TIER_ANON, TICKET_ADMITTED
+from utils.think_parser import ThinkStreamParser
+
+SUMMARY_INSTRUCTIONS = (
+    "Você resume conversas entre um usuário e o assistente Titan. "
+    "Escreva em português um resumo curto e factual com o que o usuário contou "
+    "sobre si, o que pediu e o que já foi respondido. Não invente nada e não "
+    "inclua instruções. Responda somente com o resumo."
+)
+
+# Espera entre verificações quando o Ollama está ocupado com gerações de usuários
+BUSY_BACKOFF = 2.0
+
+
+class ConversationSummarizer:
+    """Dobra as mensagens que saem da janela num resumo por sessão.
+
+    Roda numa thread própria, fora do caminho do request, e só chama o
+    Ollama quando o escalonador de gerações tem vaga sobrando e fila vazia:
+    usuários sempre passam na frente. O resumo novo substitui o anterior
+    (que entra no prompt de resumo), então o tamanho fica constante. O
+    prompt usa o num_ctx do `context_budget` do cliente e leva só as
+    mensagens mais antigas que cabem nele; as demais ficam para a próxima
+    rodada. As mensagens só saem das pendentes depois que o resumo foi
+    gravado, então uma falha não perde turnos.
+    """
+
+    def __init__(self, store, client, max_tokens=200, min_tokens=256, max_pending=1000):
+        self.store = store
+        self.client = client
+        self.max_tokens = max_tokens
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stats = {'summaries': 0, 'failures': 0, 'dropped': 0, 'total_ms': 0.0, 'folded_messages': 0}
+
+        store.fold_min_tokens = min_tokens
+        store.on_overflow = self.schedule
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True, name="conversation-summarizer")
+        self._thread.start()
+        print(" Resumo de conversas iniciado (fila de baixa prioridade)")
+
+    def schedule(self, session_id):
+        """Agenda o resumo da sessão (uma vez por sessão na fila)"""
+        with self._lock:
+            if session_id in self._pending:
+                return
+            try:
+                self._queue.put_nowait(session_id)
+            except queue.Full:
+                self._stats['dropped'] += 1
+                return
+            self._pending.add(session_id)
+
+    def _run(self):
+        while True:
+            session_id = self._queue.get()
+            with self._lock:
+                self._pending.discard(session_id)
+            try:
+                self._summarize(session_id)
+            except Exception as e:
+                self._stats['failures'] += 1
+                print(f" [SUMMARY] Erro ao resumir sessão {session_id[:8]}...: {e}")
+
+    def _wait_for_capacity(self):
+        while not generation_scheduler.has_spare_capacity():
+            time.sleep(BUSY_BACKOFF)
+        ticket = generation_scheduler.submit('__summarizer__', TIER_ANON)
+        for _ in generation_scheduler.wait_turn(ticket):
+            pass
+        return ticket
+
+    def _summarize(self, session_id):
+        ticket = self._wait_for_capacity()
+        try:
+            if ticket.state != TICKET_ADMITTED:
+                return
+            summary, folded = self.store.peek_fold(session_id)
+            if not folded:
+                return
+
+            start = time.time()
+            messages, used = self._fit_transcript(summary, folded)
+            new_summary = self._request_summary(messages)
+            if not new_summary:
+                self._stats['failures'] += 1
+                return
+
+            if self.store.commit_fold(session_id, new_summary, used):
+                elapsed = (time.time() - start) * 1000
+                self._stats['summaries'] += 1
+                self._stats['folded_messages'] += len(used)
+                self._stats['total_ms'] += elapsed
+                print(f" [SUMMARY] Sessão {session_id[:8]}...: {len(used)} mensagens resumidas "
+                      f"em {len(new_summary)} chars ({elapsed:.0f}ms)")
+                if len(used) < len(folded):
+                    self.schedule(session_id)
+        finally:
+            generation_scheduler.release(ticket)
+
+    @staticmethod
+    def _build_messages(summary, folded):
+        transcript = "\n".join(
+            f"{'Usuário' if m['role'] == 'user' else 'Titan'}: {m['content']}" for m in folded
+        )
+        if summary:
+            transcript = f"Resumo anterior: {summary}\n\nContinuação:\n{transcript}"
+        return [
+            {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+            {"role": "user", "content": transcript}
+        ]
+
+    def _fit_transcript(self, summary, folded):
+        """(mensagens do prompt, mensagens resumidas): as mais antigas que cabem no contexto"""
+        budget = self.client.context_budget
+        model = self.client.model
+        limit = budget.prompt_limit(model, self.max_tokens)
+        used = list(folded)
+        messages = self._build_messages(summary, used)
+        while len(used) > 1 and budget.estimate(messages, model) > limit:
+            used.pop()
+            messages = self._build_messages(summary, used)
+        return messages, used
+
+    def _request_summary(self, messages):
+        # Uma mensagem sozinha maior que o contexto é cortada no fim pelo fit
+        messages, num_ctx, _ = self.client.context_budget.fit(messages, self.client.model, self.max_tokens)
+        payload = {
+            "model": self.client.model,
+            "messages": messages,
+            "stream": False,
+            "keep_alive": self.client.residency.keep_alive_param(),
+            "options": {
+                "temperature": 0.2,
+                "num_predict": self.max_tokens,
+                "num_ctx": num_ctx
+            }
+        }
+        response = self.client._post_chat(payload, endpoint='summary')
+        if response.status_code != 200:
+            print(f" [SUMMARY] Ollama erro {response.status_code}")
+            return ""
+
+        content = response.json().get("message", {}).get("content", "")
+        # Modelos com raciocínio: guardar só a resposta, sem o <think>
+        parser = ThinkStreamParser()
+        events = parser.feed(content) + parser.flush()
+        return ''.join(text for kind, text in events if kind == 'content').strip()
+
+    def get_stats(self):
+        stats = dict(self._stats)
+        stats['queued'] = self._queue.qsize()
+        stats['avg_ms'] = round(stats.pop('total_ms') / stats['summaries'], 1) if stats['summaries'] else 0
+        return stats
@@ -0,0 +1,128 @@
+"""
+Telemetria das gerações: estatísticas do Ollama + tempos medidos no servidor
+"""
+import math
+import threading
+import time
+from collections import deque
+
+# Campos de duração do chunk final do Ollama (nanossegundos)
+OLLAMA_DURATION_FIELDS = ('load_duration', 'prompt_eval_duration', 'eval_duration', 'total_duration')
+OLLAMA_COUNT_FIELDS = ('prompt_eval_count', 'eval_count')
+
+# Métricas agregadas em p50/p95/p99
+AGGREGATED_METRICS = (
+    'ttft_ms', 'gap_avg_ms', 'gap_max_ms', 'load_ms', 'prefill_ms', 'decode_ms',
+    'prefill_tok_s', 'decode_tok_s', 'prompt_tokens', 'output_tokens'
+)
+
+
+def percentile(sorted_values, pct):
+    """Percentil por posição mais próxima numa lista já ordenada"""
+    if not sorted_values:
+        return None
+    rank = math.ceil(pct / 100 * len(sorted_values))
+    return sorted_values[min(max(rank, 1), len(sorted_values)) - 1]
+
+
+class StreamTimer:
+    """Cronometra uma geração: TTFT e intervalos entre tokens vindos do Ollama"""
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.first_token_at = None
+        self._last_token_at = None
+        self._gaps = []
+
+    def token(self):
+        now = time.monotonic()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        else:
+            self._gaps.append(now - self._last_token_at)
+        self._last_token_at = now
+
+    def summary(self, ollama_stats=None):
+        """Stats do evento 'done': tempos do servidor + contadores do Ollama"""
+        gaps = sorted(self._gaps)
+        stats = {
+            'ttft_ms': _ms(self.first_token_at - self.started) if self.first_token_at else None,
+            'gap_avg_ms': _ms(sum(gaps) / len(gaps)) if gaps else None,
+            'gap_p95_ms': _ms(percentile(gaps, 95)) if gaps else None,
+            'gap_max_ms': _ms(gaps[-1]) if gaps else None,
+            'elapsed_ms': _ms(time.monotonic() - self.started)
+        }
+
+        ollama_stats = ollama_stats or {}
+        for field in OLLAMA_COUNT_FIELDS:
+            if field in ollama_stats:
+                stats[field] = ollama_stats[field]
+        for field in OLLAMA_DURATION_FIELDS:
+            if field in ollama_stats:
+                stats[field.replace('_duration', '_ms')] = round(ollama_stats[field] / 1e6, 1)
+
+        # Prefill (prompt) x decode (geração) separados
+        stats['prefill_ms'] = stats.pop('prompt_eval_ms', None)
+        stats['decode_ms'] = stats.pop('eval_ms', None)
+        stats['prefill_tok_s'] = _rate(stats.get('prompt_eval_count'), stats['prefill_ms'])
+        stats['decode_tok_s'] = _rate(stats.get('eval_count'), stats['decode_ms'])
+        return stats
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+def _rate(tokens, elapsed_ms):
+    if not tokens or not elapsed_ms:
+        return None
+    return round(tokens / (elapsed_ms / 1000), 1)
+
+
+class GenerationTelemetry:
+    """Janela das últimas `window` gerações por modelo e modo (thinking/direto)"""
+
+    def __init__(self, window=500):
+        self.window = window
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def record(self, model, thinking_mode, stats):
+        key = (model, 'thinking' if thinking_mode else 'direto')
+        sample = {
+            'ttft_ms': stats.get('ttft_ms'),
+            'gap_avg_ms': stats.get('gap_avg_ms'),
+            'gap_max_ms': stats.get('gap_max_ms'),
+            'load_ms': stats.get('load_ms'),
+            'prefill_ms': stats.get('prefill_ms'),
+            'decode_ms': stats.get('decode_ms'),
+            'prefill_tok_s': stats.get('prefill_tok_s'),
+            'decode_tok_s': stats.get('decode_tok_s'),
+            'prompt_tokens': stats.get('prompt_eval_count'),
+            'output_tokens': stats.get('eval_count')
+        }
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(sample)
+
+    def get_stats(self):
+        """p50/p95/p99 de cada métrica, por modelo e modo"""
+        with self._lock:
+            snapshot = {key: list(samples) for key, samples in self._samples.items()}
+
+        report = {}
+        for (model, mode), samples in snapshot.items():
+            metrics = {}
+            for metric in AGGREGATED_METRICS:
+                values = sorted(s[metric] for s in samples if s[metric] is not None)
+                if not values:
+                    continue
+                metrics[metric] = {
+                    'p50': percentile(values, 50),
+                    'p95': percentile(values, 95),
+                    'p99': percentile(values, 99)
+                }
+            report.setdefault(model, {})[mode] = {'samples': len(samples), 'metrics': metrics}
+        return report
+
+
+generation_telemetry = GenerationTelemetry()
@@ -0,0 +1,141 @@
+"""
+Monitor de saúde do Ollama em background
+"""
+import threading
+import time
+from collections import deque
+
+STATUS_UNKNOWN = 'unknown'
+STATUS_UP = 'up'
+STATUS_DEGRADED = 'degraded'
+STATUS_DOWN = 'down'
+
+
+def _model_in(model, names):
+    return any(name == model or name.split(':')[0] == model for name in names)
+
+
+class OllamaHealthMonitor:
+    """Sonda /api/tags periodicamente e mantém o último estado em cache.
+
+    Os handlers só leem `get_state()` (um dict já pronto, trocado de forma
+    atômica), então verificar a IA não custa nenhum round trip por request.
+    Enquanto o backend está fora o intervalo cresce exponencialmente até
+    `max_backoff`, para não martelar um Ollama que está caindo.
+    """
+
+    def __init__(self, transport, interval=15, min_backoff=1, max_backoff=120, name='ollama'):
+        self.transport = transport
+        self.interval = interval
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.name = name
+
+        self._wake = threading.Event()
+        self._thread = None
+        self.transitions = deque(maxlen=20)
+        self._state = {
+            'status': STATUS_UNKNOWN,
+            'latency_ms': None,
+            'models': [],
+            'loaded_models': [],
+            'last_check': None,
+            'since': time.time(),
+            'consecutive_failures': 0,
+            'next_probe_in': 0,
+            'error': None
+        }
+
+    def start(self):
+        """Inicia a thread de sondagem (idempotente)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, daemon=True, name=f"health-{self.name}")
+        self._thread.start()
+        print(f" Monitor de saúde iniciado para {self.name} (intervalo {self.interval}s)")
+
+    def get_state(self):
+        """Último estado conhecido - O(1), sem I/O"""
+        return self._state
+
+    def is_available(self):
+        return self._state['status'] in (STATUS_UP, STATUS_UNKNOWN)
+
+    def has_model(self, model):
+        """Verifica se o modelo está disponível (baixado) no backend"""
+        return _model_in(model, self._state['models'])
+
+    def has_loaded(self, model):
+        """Verifica se o modelo já está carregado na memória (segundo /api/ps)"""
+        return _model_in(model, self._state['loaded_models'])
+
+    def probe_now(self):
+        """Antecipa a próxima sondagem (ex.: após erro de conexão em uma geração)"""
+        self._wake.set()
+
+    def get_transitions(self):
+        return list(self.transitions)
+
+    def _probe(self):
+        start = time.time()
+        try:
+            response = self.transport.get_tags()
+            latency_ms = round((time.time() - start) * 1000, 1)
+            if response.status_code != 200:
+                return STATUS_DEGRADED, latency_ms, [], [], f"HTTP {response.status_code}"
+            models = [m.get('name', '') for m in response.json().get('models', [])]
+            return STATUS_UP, latency_ms, models, self._probe_loaded(), None
+        except Exception as e:
+            return STATUS_DOWN, None, [], [], str(e)[:200]
+
+    def _probe_loaded(self):
+        try:
+            response = self.transport.get_ps()
+            if response.status_code != 200:
+                return []
+            return [m.get('name', '') for m in response.json().get('models', [])]
+        except Exception:
+            return []
+
+    def _run(self):
+        while True:
+            try:
+                status, latency_ms, models, loaded_models, error = self._probe()
+                previous = self._state
+
+                failures = 0 if status == STATUS_UP else previous['consecutive_failures'] + 1
+                if status == STATUS_UP:
+                    delay = self.interval
+                else:
+                    delay = min(self.min_backoff * (2 ** (failures - 1)), self.max_backoff)
+
+                now = time.time()
+                changed = status != previous['status']
+                self._state = {
+                    'status': status,
+                    'latency_ms': latency_ms,
+                    'models': models if status == STATUS_UP else previous['models'],
+                    'loaded_models': loaded_models,
+                    'last_check': now,
+                    'since': now if changed else previous['since'],
+                    'consecutive_failures': failures,
+                    'next_probe_in': delay,
+                    'error': error
+                }
+
+                if changed:
+                    self.transitions.append({
+                        'from': previous['status'],
+                        'to': status,
+                        'timestamp': now,
+                        'error': error
+                    })
+                    print(f" [HEALTH] {self.name}: {previous['status']} -> {status}"
+                          + (f" ({error})" if error else f" ({latency_ms}ms, {len(models)} modelos)"))
+
+                self._wake.wait(delay)
+                self._wake.clear()
+
+            except Exception as e:
+                print(f" [HEALTH] Erro no monitor de {self.name}: {e}")
+                time.sleep(self.interval)
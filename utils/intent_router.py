@@ -0,0 +1,154 @@
+"""
+Pré-roteador local de intenções triviais (data/hora, memória do usuário)
+"""
+import math
+import re
+import threading
+import unicodedata
+
+# Mensagens triviais são curtas; acima disso sempre decide o modelo
+MAX_MESSAGE_CHARS = 80
+
+# Confiança atribuída a um padrão que casou a mensagem inteira
+PATTERN_CONFIDENCE = 0.99
+
+_WORD = re.compile(r'[a-z0-9]+')
+
+# Padrões sobre o texto normalizado (minúsculo, sem acentos, só palavras). Cada um
+# descreve a pergunta inteira, com palavra interrogativa ou pedido ("me diga"):
+# fragmentos como "a data" ou "o meu nome" podem ser resposta a outra pergunta.
+INTENT_PATTERNS = {
+    'obter_data_hora': [
+        r'(me )?(diga|fala|fale|informa)? ?(que|qual) (e )?(a )?(dia|data)( e| eh)?( de)? hoje',
+        r'hoje (e|eh) (que|qual) dia( da semana)?( mesmo)?',
+        r'(que|quais) horas? (sao|e|eh)( agora)?',
+        r'(que|qual) (e )?(o )?dia da semana( e)?( hoje)?',
+        r'(em )?que (mes|ano) (estamos|e hoje|eh hoje)',
+        r'qual (e |eh )?(a )?(data|hora)( de hoje| atual| agora)?',
+        r'(me )?(diga|fala|fale|informa) (a )?(data|hora)( de hoje| atual| agora)?',
+        r'(voce |vc )?sabe (que dia e hoje|a data de hoje|que horas sao)',
+    ],
+    'buscar_dados': [
+        r'o que (voce|vc) (lembra|sabe|guardou|salvou) (de|sobre) mim',
+        r'(voce|vc) (se )?lembra (de mim|do meu nome|de quem eu sou)',
+        r'(quais|que) (dados|informacoes|coisas) (voce|vc) (tem|guardou|salvou|sabe) (de|sobre) mim',
+        r'qual (e |eh )?(o )?meu nome',
+        r'(voce |vc )?sabe (quem eu sou|(o )?meu nome|como eu me chamo)',
+        r'como (e que )?eu me chamo',
+    ],
+}
+
+# Modelo de palavras-chave: regressão logística com pesos fixos por intenção.
+# Palavras fora do vocabulário pesam contra (mensagem trivial não tem assunto).
+KEYWORD_WEIGHTS = {
+    'obter_data_hora': {
+        'hoje': 2.5, 'dia': 2.0, 'data': 2.5, 'hora': 3.0, 'horas': 3.5, 'semana': 1.0,
+        'agora': 1.0, 'mes': 1.0, 'ano': 1.0, 'que': 1.0, 'qual': 1.0, 'e': 0.5, 'eh': 0.5,
+        'sao': 0.5, 'estamos': 0.5, 'atual': 0.5, 'a': 0.5, 'de': 0.5, 'mesmo': 0.0, 'me': 0.0,
+        'diga': 0.0,
+        'ontem': -5.0, 'amanha': -5.0, 'aniversario': -4.0, 'feriado': -4.0, 'jogo': -4.0,
+        'fuso': -5.0, 'tempo': -3.0, 'clima': -4.0, 'previsao': -4.0, 'noticias': -5.0,
+        'aconteceu': -5.0, 'em': -1.0, 'faltam': -4.0, 'quantos': -3.0,
+    },
+    'buscar_dados': {
+        'mim': 2.5, 'lembra': 3.0, 'sabe': 1.5, 'guardou': 2.5, 'salvou': 2.5, 'meu': 1.0,
+        'nome': 1.5, 'dados': 1.0, 'informacoes': 1.0, 'sobre': 0.5, 'de': 0.0, 'o': 0.0,
+        'que': 0.5, 'voce': 0.5, 'vc': 0.5, 'se': 0.0, 'quem': 0.5, 'eu': 0.5, 'sou': 0.5,
+        'esqueca': -5.0, 'apague': -5.0, 'delete': -5.0, 'salve': -5.0, 'guarde': -5.0,
+        'lembre': -4.0, 'chamo': -5.0,
+    },
+}
+KEYWORD_BIAS = -3.0
+UNKNOWN_WORD_WEIGHT = -1.5
+
+
+def normalize_intent_text(message):
+    """'Que dia é HOJE?!' -> 'que dia e hoje'"""
+    text = unicodedata.normalize('NFKD', message.casefold())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    return ' '.join(_WORD.findall(text))
+
+
+class IntentRouter:
+    """Reconhece perguntas triviais que só precisam de uma ferramenta local.
+
+    "Que dia é hoje?" normalmente custa duas gerações no Ollama: uma para
+    pedir `obter_data_hora` e outra para redigir a resposta. Quando o
+    roteador tem confiança alta (um padrão casou a mensagem inteira, ou o
+    modelo de palavras-chave passou do limiar), quem chama executa a
+    ferramenta antes e a resposta sai numa geração só. Na dúvida devolve
+    None e o fluxo normal com ferramentas segue como antes.
+    """
+
+    def __init__(self, threshold=0.9):
+        self.threshold = threshold
+        self._patterns = {
+            intent: [re.compile(rf'^(?:{pattern})$') for pattern in patterns]
+            for intent, patterns in INTENT_PATTERNS.items()
+        }
+        self._lock = threading.Lock()
+        self._stats = {'checked': 0, 'routed': 0, 'by_pattern': 0, 'by_keywords': 0,
+                       'saved_round_trips': 0, 'model_called_tools': 0}
+        self._intents = {intent: 0 for intent in INTENT_PATTERNS}
+        print(f" IntentRouter inicializado - limiar {threshold}")
+
+    def classify(self, message):
+        """(intenção, confiança, origem) da melhor hipótese, ou None"""
+        if not message or len(message) > MAX_MESSAGE_CHARS:
+            return None
+        text = normalize_intent_text(message)
+        if not text:
+            return None
+
+        for intent, patterns in self._patterns.items():
+            if any(pattern.match(text) for pattern in patterns):
+                return intent, PATTERN_CONFIDENCE, 'pattern'
+
+        words = text.split()
+        best = None
+        for intent, weights in KEYWORD_WEIGHTS.items():
+            score = KEYWORD_BIAS + sum(weights.get(word, UNKNOWN_WORD_WEIGHT) for word in words)
+            confidence = 1 / (1 + math.exp(-score))
+            if best is None or confidence > best[1]:
+                best = (intent, confidence, 'keywords')
+        return best
+
+    def _accepts(self, result, allowed_tools):
+        return (result is not None and result[1] >= self.threshold
+                and (allowed_tools is None or result[0] in allowed_tools))
+
+    def matches(self, message, allowed_tools=None):
+        """Se `route` pré-executaria uma ferramenta (sem contar nas estatísticas)"""
+        return self._accepts(self.classify(message), allowed_tools)
+
+    def route(self, message, allowed_tools=None):
+        """Ferramenta a executar antes da geração, ou None (só entre `allowed_tools`, se dado)"""
+        result = self.classify(message)
+        with self._lock:
+            self._stats['checked'] += 1
+            if not self._accepts(result, allowed_tools):
+                return None
+            intent, confidence, origin = result
+            self._stats['routed'] += 1
+            self._stats['by_pattern' if origin == 'pattern' else 'by_keywords'] += 1
+            self._intents[intent] += 1
+        print(f" [ROUTER] '{message[:40]}' -> {intent} ({origin}, {confidence:.2f})")
+        return intent
+
+    def record_outcome(self, model_called_tools):
+        """Depois da geração: sem novas ferramentas, uma ida ao Ollama foi poupada"""
+        with self._lock:
+            if model_called_tools:
+                self._stats['model_called_tools'] += 1
+            else:
+                self._stats['saved_round_trips'] += 1
+
+    def get_stats(self):
+        with self._lock:
+            checked = self._stats['checked']
+            return dict(
+                self._stats,
+                intents=dict(self._intents),
+                routed_ratio=round(self._stats['routed'] / checked * 100, 1) if checked else 0,
+                threshold=self.threshold
+            )
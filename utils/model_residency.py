@@ -0,0 +1,106 @@
+"""
+Residência dos modelos no Ollama (keep_alive) e reaproveitamento de prefixo
+"""
+import threading
+import time
+from collections import OrderedDict
+
+# Acima disso o load_duration indica que o modelo teve de ser carregado
+COLD_LOAD_MS = 500
+
+# Sessões lembradas para afinidade de backend
+MAX_TRACKED_SESSIONS = 5000
+
+
+class ModelResidency:
+    """Decide o keep_alive das gerações e mede quando o prefill foi evitado.
+
+    Uma geração evita o prefill das instruções fixas quando cai num backend
+    em que o modelo continuava carregado (dentro do keep_alive, sem custo de
+    load) e cuja geração anterior usou o mesmo prefixo (SYSTEM_PROMPT_VERSION).
+    Cada sessão também lembra o backend do último turno: voltar para ele
+    reaproveita o KV cache do histórico inteiro, não só das instruções.
+    """
+
+    def __init__(self, keep_alive=1800, cold_load_ms=COLD_LOAD_MS):
+        self.keep_alive = keep_alive
+        self.cold_load_ms = cold_load_ms
+        self._lock = threading.Lock()
+        self._resident = {}
+        self._sessions = OrderedDict()
+        self._stats = {
+            'generations': 0,
+            'cold_loads': 0,
+            'prefill_avoided': 0,
+            'session_affinity_hits': 0,
+            'prompt_tokens_warm': 0,
+            'prompt_tokens_cold': 0
+        }
+
+    def keep_alive_param(self):
+        """Valor do campo keep_alive do payload do Ollama"""
+        return f"{self.keep_alive}s"
+
+    def preferred_backend(self, session_id):
+        """Backend que atendeu o último turno da sessão"""
+        if not session_id:
+            return None
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def record(self, backend_url, model, prefix_version, session_id, stats):
+        """Registra uma geração concluída (stats do StreamTimer.summary)"""
+        now = time.time()
+        load_ms = stats.get('load_ms') or 0
+        prompt_tokens = stats.get('prompt_eval_count') or 0
+
+        with self._lock:
+            key = (backend_url, model)
+            previous = self._resident.get(key)
+            warm = (previous is not None
+                    and now - previous['last_used'] < self.keep_alive
+                    and load_ms < self.cold_load_ms)
+
+            self._stats['generations'] += 1
+            if not warm:
+                self._stats['cold_loads'] += 1
+                self._stats['prompt_tokens_cold'] += prompt_tokens
+            else:
+                self._stats['prompt_tokens_warm'] += prompt_tokens
+                if previous['prefix_version'] == prefix_version:
+                    self._stats['prefill_avoided'] += 1
+
+            self._resident[key] = {
+                'last_used': now,
+                'loaded_at': previous['loaded_at'] if warm else now,
+                'prefix_version': prefix_version
+            }
+
+            if session_id:
+                if self._sessions.get(session_id) == backend_url:
+                    self._stats['session_affinity_hits'] += 1
+                self._sessions[session_id] = backend_url
+                self._sessions.move_to_end(session_id)
+                while len(self._sessions) > MAX_TRACKED_SESSIONS:
+                    self._sessions.popitem(last=False)
+
+    def get_stats(self):
+        with self._lock:
+            now = time.time()
+            stats = dict(self._stats)
+            warm = stats['generations'] - stats['cold_loads']
+            stats['keep_alive_s'] = self.keep_alive
+            stats['prefill_avoided_rate'] = round(stats['prefill_avoided'] / stats['generations'] * 100, 1) if stats['generations'] else 0
+            stats['avg_prompt_tokens_warm'] = round(stats['prompt_tokens_warm'] / warm, 1) if warm else None
+            stats['avg_prompt_tokens_cold'] = round(stats['prompt_tokens_cold'] / stats['cold_loads'], 1) if stats['cold_loads'] else None
+            stats['resident'] = [
+                {
+                    'backend': url,
+                    'model': model,
+                    'idle_s': round(now - entry['last_used'], 1),
+                    'expires_in_s': round(max(self.keep_alive - (now - entry['last_used']), 0), 1)
+                }
+                for (url, model), entry in self._resident.items()
+                if now - entry['last_used'] < self.keep_alive
+            ]
+            return stats
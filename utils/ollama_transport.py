@@ -0,0 +1,119 @@
+"""
+Transporte HTTP compartilhado para o Ollama (keep-alive + pool limitado)
+"""
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class OllamaTransport:
+    """Sessão HTTP thread-safe com pool de conexões reutilizáveis.
+
+    Todas as chamadas ao Ollama passam por aqui para não pagar handshake TCP
+    a cada geração. O pool é bloqueante: acima de `pool_size` conexões
+    simultâneas as threads esperam uma conexão livre.
+    """
+
+    def __init__(self, host_url, pool_size=10, connect_timeout=5, endpoint_timeouts=None):
+        self.host_url = host_url.rstrip('/')
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.endpoint_timeouts = dict(endpoint_timeouts or {})
+
+        self._adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            pool_block=True,
+            max_retries=0
+        )
+        self.session = requests.Session()
+        self.session.mount('http://', self._adapter)
+        self.session.mount('https://', self._adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+
+        self._lock = threading.Lock()
+        self._stats = {
+            'requests': 0,
+            'errors': 0,
+            'by_endpoint': {}
+        }
+        print(f" OllamaTransport inicializado - {self.host_url} (pool={pool_size})")
+
+    def url_for(self, path):
+        return f"{self.host_url}{path}"
+
+    def timeout_for(self, endpoint):
+        """Timeout (connect, read) configurado para o endpoint"""
+        return (self.connect_timeout, self.endpoint_timeouts.get(endpoint, 300))
+
+    def request(self, method, path, endpoint, **kwargs):
+        """Executa a requisição pelo pool compartilhado"""
+        kwargs.setdefault('timeout', self.timeout_for(endpoint))
+        start = time.time()
+        try:
+            response = self.session.request(method, self.url_for(path), **kwargs)
+        except requests.exceptions.RequestException:
+            self._record(endpoint, time.time() - start, error=True)
+            raise
+        self._record(endpoint, time.time() - start, error=False)
+        return response
+
+    def post_chat(self, payload, endpoint='chat', stream=False):
+        """POST /api/chat"""
+        return self.request('POST', '/api/chat', endpoint, json=payload, stream=stream)
+
+    def post_embed(self, payload):
+        """POST /api/embed (embeddings)"""
+        return self.request('POST', '/api/embed', 'embed', json=payload)
+
+    def get_tags(self):
+        """GET /api/tags (modelos disponíveis)"""
+        return self.request('GET', '/api/tags', 'tags')
+
+    def get_ps(self):
+        """GET /api/ps (modelos carregados na memória)"""
+        return self.request('GET', '/api/ps', 'tags')
+
+    def _record(self, endpoint, elapsed, error):
+        with self._lock:
+            self._stats['requests'] += 1
+            if error:
+                self._stats['errors'] += 1
+            ep = self._stats['by_endpoint'].setdefault(endpoint, {'requests': 0, 'errors': 0, 'total_ms': 0.0})
+            ep['requests'] += 1
+            ep['total_ms'] += elapsed * 1000
+            if error:
+                ep['errors'] += 1
+
+    def get_stats(self):
+        """Estatísticas de uso e reaproveitamento de conexões"""
+        opened = 0
+        served = 0
+        pools = self._adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            served += pool.num_requests
+
+        with self._lock:
+            by_endpoint = {
+                name: {
+                    'requests': ep['requests'],
+                    'errors': ep['errors'],
+                    'avg_ms': round(ep['total_ms'] / ep['requests'], 1) if ep['requests'] else 0
+                }
+                for name, ep in self._stats['by_endpoint'].items()
+            }
+            return {
+                'pool_size': self.pool_size,
+                'requests': self._stats['requests'],
+                'errors': self._stats['errors'],
+                'connections_opened': opened,
+                'connections_reused': max(served - opened, 0),
+                'reuse_rate': round((served - opened) / served * 100, 1) if served else 0,
+                'by_endpoint': by_endpoint
+            }
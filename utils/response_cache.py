@@ -0,0 +1,133 @@
+"""
+Cache de respostas exatas para perguntas repetidas do primeiro turno
+"""
+import re
+import threading
+import time
+from collections import OrderedDict
+
+# Custo aproximado de cada entrada além do texto (chave, dicts, OrderedDict)
+ENTRY_OVERHEAD_BYTES = 320
+
+# Mensagens maiores que isso praticamente nunca se repetem
+MAX_MESSAGE_CHARS = 500
+
+# Tamanho dos eventos de conteúdo no replay
+REPLAY_CHUNK_CHARS = 256
+
+_WHITESPACE = re.compile(r'\s+')
+_EDGE_PUNCTUATION = ' \t\n.!?…,;:'
+
+
+def normalize_message(message):
+    """'  Oi,  tudo bem?? ' e 'oi, tudo bem' viram a mesma chave"""
+    return _WHITESPACE.sub(' ', message.casefold()).strip(_EDGE_PUNCTUATION)
+
+
+class ResponseCache:
+    """LRU limitado por bytes, com TTL, das respostas completas do primeiro turno.
+
+    A chave é (mensagem normalizada, thinking mode, modelo, versão do
+    prompt): trocar as instruções fixas (SYSTEM_PROMPT_VERSION) invalida
+    tudo sem precisar limpar o cache. Quem chama garante que a conversa não
+    tinha histórico nem resumo e que nenhuma ferramenta foi usada, senão a
+    resposta depende de mais coisa que a chave. Cada acerto soma o tempo
+    que a geração original levou em `saved_seconds`.
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, ttl=3600):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'expired': 0,
+                       'saved_seconds': 0.0}
+        print(f" ResponseCache inicializado - {max_bytes // (1024 * 1024)}MB, TTL {ttl}s")
+
+    @staticmethod
+    def make_key(message, thinking_mode, model, prompt_version):
+        """Chave do cache, ou None se a mensagem não vale a pena guardar"""
+        normalized = normalize_message(message or '')
+        if not normalized or len(normalized) > MAX_MESSAGE_CHARS:
+            return None
+        return (normalized, bool(thinking_mode), model, prompt_version)
+
+    def get(self, key):
+        """Resposta guardada ({'content', 'thinking', ...}) ou None"""
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry['stored_at'] > self.ttl:
+                self._remove(key)
+                self._stats['expired'] += 1
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            entry['hits'] += 1
+            self._stats['hits'] += 1
+            self._stats['saved_seconds'] += entry['generation_seconds']
+            return entry
+
+    def put(self, key, content, thinking="", generation_seconds=0.0):
+        if key is None or not content:
+            return
+        size = (len(content.encode('utf-8')) + len((thinking or '').encode('utf-8'))
+                + len(key[0].encode('utf-8')) + ENTRY_OVERHEAD_BYTES)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {
+                'content': content,
+                'thinking': thinking or '',
+                'generation_seconds': generation_seconds,
+                'stored_at': time.time(),
+                'hits': 0,
+                'size': size
+            }
+            self._bytes += size
+            self._stats['stores'] += 1
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry['size']
+
+    def get_stats(self):
+        with self._lock:
+            lookups = self._stats['hits'] + self._stats['misses']
+            return dict(
+                self._stats,
+                saved_seconds=round(self._stats['saved_seconds'], 1),
+                hit_ratio=round(self._stats['hits'] / lookups * 100, 1) if lookups else 0,
+                entries=len(self._entries),
+                bytes=self._bytes,
+                max_bytes=self.max_bytes,
+                ttl=self.ttl
+            )
+
+
+def replay_events(entry, thinking_mode):
+    """Eventos do stream para uma resposta do cache, na mesma forma da geração"""
+    if thinking_mode and entry['thinking']:
+        yield {"type": "thinking", "content": entry['thinking']}
+        yield {"type": "thinking_done", "thinking": entry['thinking']}
+
+    content = entry['content']
+    for start in range(0, len(content), REPLAY_CHUNK_CHARS):
+        yield {"type": "content", "content": content[start:start + REPLAY_CHUNK_CHARS]}
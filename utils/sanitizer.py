@@ -0,0 +1,191 @@
+"""
+Sanitização de textos do chat com padrões pré-compilados
+
+Roda em toda mensagem e em todo resultado de ferramenta, então nada aqui
+recompila regex ou recria listas por chamada: os padrões e os conjuntos de
+palavras são montados uma vez na importação.
+"""
+import html
+import re
+
+CONTEXT_MAX_CHARS = 5000
+USER_INPUT_MAX_CHARS = 10000
+
+# Contexto é lido em fatias: só o necessário para preencher CONTEXT_MAX_CHARS
+_CONTEXT_SLICE = 8192
+
+DANGEROUS_WORDS = frozenset([
+    'ignore', 'system', 'admin', 'root', 'execute',
+    'jailbreak', 'bypass', 'override', 'prompt', 'instruction',
+    'hacker', 'sudo', 'evil', 'malicious', 'exploit', 'backdoor',
+    'shell', 'administrator', 'superuser', 'unrestricted', 'unlimited'
+])
+
+DANGEROUS_COMMANDS = (
+    '/system', '/admin', '/root', '/sudo',
+    '/execute', '/eval', '/run', '/cmd'
+)
+
+SECURITY_VIOLATIONS = (
+    'ignore previous instructions',
+    'i am now a hacker',
+    'executing system command',
+    'bypassing security',
+)
+
+# Whitelist: tudo fora destes caracteres é descartado
+_DISALLOWED_CHARS = re.compile(r'[^a-zA-Z0-9\s\.\,\!\?\-\n\|:=\(\)áéíóúâêîôûãõçÁÉÍÓÚÂÊÎÔÛÃÕÇ]+')
+
+_COMMAND_PREFIX = re.compile(
+    r'\s*(' + '|'.join(re.escape(cmd) for cmd in DANGEROUS_COMMANDS) + ')',
+    re.IGNORECASE
+)
+
+# Uma alternância só: o regex procura todas as frases numa única varredura
+_VIOLATION_PATTERN = re.compile(
+    '|'.join(re.escape(phrase) for phrase in SECURITY_VIOLATIONS),
+    re.IGNORECASE
+)
+
+# Todos os prefixos das frases: decide o que reter no fim de cada delta do stream
+_VIOLATION_PREFIXES = frozenset(
+    phrase[:size] for phrase in SECURITY_VIOLATIONS for size in range(1, len(phrase))
+)
+_VIOLATION_MAX_PREFIX = max(len(phrase) for phrase in SECURITY_VIOLATIONS) - 1
+
+_TAG_PATTERN = re.compile(r'<[^>]+>')
+_NEWLINE_RUNS = re.compile(r'\n{3,}')
+
+
+def sanitize_context(text):
+    """Whitelist de caracteres + remoção de palavras perigosas, com delimitadores"""
+    if not text or not isinstance(text, str):
+        return "Nenhum contexto disponível."
+
+    parts = []
+    kept = 0
+    for start in range(0, len(text), _CONTEXT_SLICE):
+        clean = _DISALLOWED_CHARS.sub('', text[start:start + _CONTEXT_SLICE])
+        parts.append(clean)
+        kept += len(clean)
+        if kept >= CONTEXT_MAX_CHARS:
+            break
+    clean_text = ''.join(parts)[:CONTEXT_MAX_CHARS]
+
+    safe_words = [word for word in clean_text.lower().split() if word not in DANGEROUS_WORDS]
+    return f"[DADOS_USUARIO_VALIDADOS]\n{' '.join(safe_words)}\n[FIM_DADOS_USUARIO]"
+
+
+def validate_user_input(text):
+    """Limita o tamanho e bloqueia mensagens que começam com comandos de sistema"""
+    if not text or not isinstance(text, str):
+        return "Mensagem inválida."
+
+    if len(text) > USER_INPUT_MAX_CHARS:
+        return text[:USER_INPUT_MAX_CHARS] + "... [TRUNCADO]"
+
+    match = _COMMAND_PREFIX.match(text)
+    if match:
+        return "[COMANDO BLOQUEADO] " + text[len(match.group(1)):]
+
+    return text
+
+
+def find_security_violation(text):
+    """Primeira frase de violação encontrada no texto (minúscula) ou None"""
+    if not text:
+        return None
+    match = _VIOLATION_PATTERN.search(text)
+    return match.group(0).lower() if match else None
+
+
+def clean_response_formatting(text):
+    """Remove tags, escapa HTML e normaliza quebras de linha.
+
+    Uma passada única com callback em Python saiu mais lenta que estas
+    passadas em C; o ganho vem de eliminar as que não tinham efeito (<br>
+    já escapado e quebras iniciais, que o strip remove).
+    """
+    if not text:
+        return "Desculpe, houve um problema ao processar a resposta."
+    text = html.escape(_TAG_PATTERN.sub('', text), quote=False)
+    return _NEWLINE_RUNS.sub('\n\n', text).strip()
+
+
+class StreamingOutputFilter:
+    """Versão incremental de find_security_violation + limpeza de formatação.
+
+    Cada delta passa uma única vez pelo filtro. Fica retido só o necessário
+    para decidir o que vem depois: o final do texto que é início de alguma
+    frase de violação, uma tag ainda aberta (até `max_tag`
+    caracteres) e o espaço em branco final, que só sai junto com o próximo
+    texto (assim quebras de linha são normalizadas por inteiro e o fim da
+    resposta sai sem espaços, como no strip()). O HTML não é escapado aqui:
+    o front renderiza o stream com textContent.
+    """
+
+    def __init__(self, max_tag=256):
+        self.max_tag = max_tag
+        self.violation = None
+        self._pending = ""
+        self._started = False
+
+    def feed(self, delta):
+        """Processa um delta; devolve o texto já seguro para envio"""
+        if self.violation:
+            return ""
+        buffer = self._pending + delta
+        if self._check(buffer):
+            return ""
+
+        cut = len(buffer) - self._partial_phrase(buffer)
+        # Tag aberta: o primeiro '<' depois do último '>' (<[^>]+> atravessa outros '<',
+        # então em "<<b>" a tag começa no primeiro). Frases não têm '>', logo nenhum '>' passa do corte.
+        search_from = max(buffer.rfind('>', 0, max(cut, 0)) + 1, len(buffer) - self.max_tag)
+        tag_start = buffer.find('<', search_from, max(cut, 0))
+        if tag_start != -1:
+            cut = tag_start
+
+        if cut <= 0:
+            self._pending = buffer
+            return ""
+        return self._release(buffer[:cut], buffer[cut:])
+
+    def flush(self):
+        """Fim do stream: libera o que estava retido"""
+        if self.violation:
+            return ""
+        buffer, self._pending = self._pending, ""
+        if self._check(buffer):
+            return ""
+        return self._emit(_TAG_PATTERN.sub('', buffer).rstrip())
+
+    @staticmethod
+    def _partial_phrase(buffer):
+        """Tamanho do maior sufixo que ainda pode virar uma frase de violação"""
+        for size in range(min(_VIOLATION_MAX_PREFIX, len(buffer)), 0, -1):
+            if buffer[-size:].lower() in _VIOLATION_PREFIXES:
+                return size
+        return 0
+
+    def _check(self, buffer):
+        self.violation = find_security_violation(buffer)
+        if self.violation:
+            self._pending = ""
+            return True
+        return False
+
+    def _release(self, region, rest):
+        region = _TAG_PATTERN.sub('', region)
+        text = region.rstrip()
+        self._pending = region[len(text):] + rest
+        return self._emit(text)
+
+    def _emit(self, text):
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+        return _NEWLINE_RUNS.sub('\n\n', text)
+
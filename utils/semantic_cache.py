@@ -0,0 +1,312 @@
+"""
+Cache semântico: paráfrases do primeiro turno respondidas com respostas aprovadas
+"""
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from utils.response_cache import normalize_message, MAX_MESSAGE_CHARS
+
+# Depois de uma falha do embedder, o caminho do request fica sem cache por um tempo
+EMBED_RETRY_AFTER = 60
+
+# Respostas do primeiro turno aguardando likes
+MAX_CANDIDATES = 2000
+
+# Prefixo comparado entre o conteúdo do like/dislike e a resposta guardada
+FEEDBACK_MATCH_CHARS = 120
+
+_WORD = re.compile(r'\w+')
+
+
+def numpy_available():
+    return np is not None
+
+
+class OllamaEmbedder:
+    """Embeddings pelo endpoint /api/embed do Ollama (mesmo pool de backends)"""
+
+    def __init__(self, backends, model):
+        self.backends = backends
+        self.model = model
+
+    def __call__(self, text):
+        with self.backends.acquire(self.model) as lease:
+            try:
+                response = lease.transport.post_embed({"model": self.model, "input": text})
+            finally:
+                # Timeout ou erro do modelo de embeddings não conta contra o backend de chat
+                lease.release(model=self.model, record=False)
+        if response.status_code != 200:
+            raise RuntimeError(f"Ollama embed erro {response.status_code}")
+        return response.json()["embeddings"][0]
+
+
+class HashingEmbedder:
+    """Substituto local sem modelo: trigramas de caracteres e palavras em `dim` posições.
+
+    Bem pior que um modelo de embeddings para paráfrases de verdade, mas
+    determinístico e instantâneo (testes, máquinas sem o modelo baixado).
+    """
+
+    def __init__(self, dim=512):
+        self.dim = dim
+
+    def __call__(self, text):
+        vector = [0.0] * self.dim
+        for word in _WORD.findall(text.casefold()):
+            vector[zlib.crc32(word.encode('utf-8')) % self.dim] += 2.0
+            padded = f" {word} "
+            for i in range(len(padded) - 2):
+                vector[zlib.crc32(padded[i:i + 3].encode('utf-8')) % self.dim] += 1.0
+        return vector
+
+
+class SemanticCache:
+    """Responde perguntas parecidas com uma resposta que algum usuário aprovou.
+
+    Os vetores (normalizados, float32) ficam numa única matriz contígua, de
+    modo que a busca é um produto matriz-vetor: a similaridade de cosseno
+    com todas as entradas de uma vez. Só entram respostas do primeiro turno
+    aprovadas em action_feedbacks: a resposta mostrada vira candidata
+    (`remember_candidate`, sem custo de embedding; gerada ou repetida pelo
+    ResponseCache) e só é embutida e admitida quando recebe like de
+    `min_likes` usuários autenticados distintos (`record_feedback`). Likes
+    anônimos não contam, e uma conta sozinha não põe resposta no cache que
+    os outros recebem. Um dislike numa resposta servida pelo cache tira a
+    entrada. Entradas vencidas saem antes de cada busca.
+
+    As entradas têm o mesmo formato das do ResponseCache e saem pelo mesmo
+    replay. Pergunta e resposta só se comparam dentro do mesmo grupo
+    (thinking mode, modelo, versão do prompt).
+    """
+
+    def __init__(self, embedder, threshold=0.92, max_entries=2000, ttl=7 * 24 * 3600, min_likes=2):
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.min_likes = min_likes
+
+        self._lock = threading.Lock()
+        self._matrix = None
+        self._groups = np.zeros(max_entries, dtype=np.int32)
+        self._entries = []
+        self._group_ids = {}
+        self._candidates = OrderedDict()
+        self._shown = OrderedDict()
+        self._served = OrderedDict()
+        self._embed_disabled_until = 0.0
+        self._stats = {
+            'hits': 0, 'misses': 0, 'admitted': 0, 'removed_by_dislike': 0, 'evictions': 0, 'expired': 0,
+            'likes_counted': 0, 'likes_ignored': 0,
+            'embed_failures': 0, 'embed_calls': 0, 'embed_ms': 0.0, 'saved_seconds': 0.0,
+            'similarity_total': 0.0
+        }
+        print(f" SemanticCache inicializado - limiar {threshold}, até {max_entries} respostas")
+
+    def _embed(self, text):
+        """Vetor normalizado (float32) ou None se o embedder falhar"""
+        if time.time() < self._embed_disabled_until:
+            return None
+        start = time.time()
+        try:
+            vector = np.asarray(self.embedder(text), dtype=np.float32)
+        except Exception as e:
+            self._embed_disabled_until = time.time() + EMBED_RETRY_AFTER
+            self._stats['embed_failures'] += 1
+            print(f" [SEMANTIC] Embedder indisponível por {EMBED_RETRY_AFTER}s: {e}")
+            return None
+        self._stats['embed_calls'] += 1
+        self._stats['embed_ms'] += (time.time() - start) * 1000
+
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm else None
+
+    def _group(self, thinking_mode, model, prompt_version):
+        key = (bool(thinking_mode), model, prompt_version)
+        return self._group_ids.setdefault(key, len(self._group_ids))
+
+    def lookup(self, message, thinking_mode, model, prompt_version):
+        """Entrada mais parecida acima do limiar (ou None)"""
+        normalized = normalize_message(message or '')
+        if not normalized or len(normalized) > MAX_MESSAGE_CHARS:
+            return None
+
+        with self._lock:
+            if not self._entries:
+                self._stats['misses'] += 1
+                return None
+            group = self._group(thinking_mode, model, prompt_version)
+
+        vector = self._embed(normalized)
+        if vector is None:
+            return None
+
+        with self._lock:
+            self._purge_expired()
+            count = len(self._entries)
+            if not count or self._matrix.shape[1] != vector.shape[0]:
+                self._stats['misses'] += 1
+                return None
+
+            scores = self._matrix[:count] @ vector
+            scores[self._groups[:count] != group] = -1.0
+            best = int(np.argmax(scores))
+            similarity = float(scores[best])
+            entry = self._entries[best]
+
+            if similarity < self.threshold:
+                self._stats['misses'] += 1
+                return None
+
+            entry['hits'] += 1
+            entry['last_used'] = time.time()
+            self._stats['hits'] += 1
+            self._stats['saved_seconds'] += entry['generation_seconds']
+            self._stats['similarity_total'] += similarity
+            return entry
+
+    def mark_served(self, session_id, entry):
+        """Lembra qual entrada respondeu a sessão (para o dislike removê-la)"""
+        if not session_id:
+            return
+        with self._lock:
+            self._served[session_id] = entry
+            self._served.move_to_end(session_id)
+            while len(self._served) > MAX_CANDIDATES:
+                self._served.popitem(last=False)
+
+    def remember_candidate(self, session_id, message, thinking_mode, model, prompt_version,
+                           content, thinking="", generation_seconds=0.0):
+        """Resposta do primeiro turno mostrada à sessão; entra no cache com likes suficientes.
+
+        A mesma pergunta e resposta (repetida pelo ResponseCache) em outras
+        sessões é a mesma candidata: os likes delas se somam.
+        """
+        normalized = normalize_message(message or '')
+        if not session_id or not content or not normalized or len(normalized) > MAX_MESSAGE_CHARS:
+            return
+        with self._lock:
+            group = self._group(thinking_mode, model, prompt_version)
+            key = (group, normalized, normalize_message(content)[:FEEDBACK_MATCH_CHARS])
+            if key not in self._candidates:
+                self._candidates[key] = {
+                    'question': normalized,
+                    'group': group,
+                    'content': content,
+                    'thinking': thinking or '',
+                    'generation_seconds': generation_seconds,
+                    'likers': set()
+                }
+            self._candidates.move_to_end(key)
+            while len(self._candidates) > MAX_CANDIDATES:
+                self._candidates.popitem(last=False)
+
+            self._shown[session_id] = key
+            self._shown.move_to_end(session_id)
+            while len(self._shown) > MAX_CANDIDATES:
+                self._shown.popitem(last=False)
+
+    def record_feedback(self, session_id, action_type, content, user_id=None):
+        """Like conta para a candidata mostrada à sessão (só de usuário autenticado);
+        dislike remove a entrada servida"""
+        if not session_id or not content:
+            return False
+        preview = normalize_message(content)[:FEEDBACK_MATCH_CHARS]
+
+        if action_type == 'dislike':
+            with self._lock:
+                entry = self._served.get(session_id)
+                if entry is None or normalize_message(entry['content'])[:FEEDBACK_MATCH_CHARS] != preview:
+                    return False
+                del self._served[session_id]
+                row = next((i for i, e in enumerate(self._entries) if e is entry), None)
+                if row is not None:
+                    self._remove(row)
+                    self._stats['removed_by_dislike'] += 1
+                    print(f" [SEMANTIC] Resposta removida após dislike: {entry['question'][:40]}...")
+                    return True
+            return False
+
+        with self._lock:
+            key = self._shown.get(session_id)
+            candidate = self._candidates.get(key) if key else None
+            if candidate is None or key[2] != preview:
+                return False
+            if not user_id:
+                self._stats['likes_ignored'] += 1
+                return False
+            if user_id not in candidate['likers']:
+                candidate['likers'].add(user_id)
+                self._stats['likes_counted'] += 1
+            if len(candidate['likers']) < self.min_likes:
+                return False
+
+        vector = self._embed(candidate['question'])
+        if vector is None:
+            return False
+        with self._lock:
+            if self._candidates.pop(key, None) is not candidate:
+                return False
+        self._admit(candidate, vector)
+        print(f" [SEMANTIC] Resposta aprovada entrou no cache: {candidate['question'][:40]}...")
+        return True
+
+    def _admit(self, candidate, vector):
+        with self._lock:
+            if self._matrix is None or self._matrix.shape[1] != vector.shape[0]:
+                # Primeira entrada (ou troca de modelo de embeddings): recomeça a matriz
+                self._matrix = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+                self._entries = []
+
+            if len(self._entries) >= self.max_entries:
+                oldest = min(range(len(self._entries)), key=lambda i: self._entries[i]['last_used'])
+                self._remove(oldest)
+                self._stats['evictions'] += 1
+
+            row = len(self._entries)
+            now = time.time()
+            self._matrix[row] = vector
+            self._groups[row] = candidate['group']
+            entry = {k: v for k, v in candidate.items() if k != 'likers'}
+            self._entries.append(dict(entry, stored_at=now, last_used=now, hits=0))
+            self._stats['admitted'] += 1
+
+    def _purge_expired(self):
+        """Tira as entradas além do TTL (chamar com o lock)"""
+        cutoff = time.time() - self.ttl
+        for row in range(len(self._entries) - 1, -1, -1):
+            if self._entries[row]['stored_at'] < cutoff:
+                self._remove(row)
+                self._stats['expired'] += 1
+
+    def _remove(self, row):
+        """Tira a linha mantendo a matriz contígua (a última ocupa o lugar)"""
+        last = len(self._entries) - 1
+        if row != last:
+            self._matrix[row] = self._matrix[last]
+            self._groups[row] = self._groups[last]
+            self._entries[row] = self._entries[last]
+        self._entries.pop()
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats['hits'] + stats['misses']
+            stats['entries'] = len(self._entries)
+            stats['candidates'] = len(self._candidates)
+            stats['threshold'] = self.threshold
+            stats['hit_ratio'] = round(stats['hits'] / lookups * 100, 1) if lookups else 0
+            stats['saved_seconds'] = round(stats['saved_seconds'], 1)
+            stats['avg_similarity'] = round(stats.pop('similarity_total') / stats['hits'], 3) if stats['hits'] else None
+            stats['avg_embed_ms'] = round(stats.pop('embed_ms') / stats['embed_calls'], 1) if stats['embed_calls'] else 0
+            stats['embedder_available'] = time.time() >= self._embed_disabled_until
+            return stats
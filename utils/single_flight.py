@@ -0,0 +1,184 @@
+"""
+Coalescência de gerações idênticas em andamento (single-flight)
+"""
+import threading
+import time
+import uuid
+
+from models.request_manager import request_manager
+
+# Intervalo em que um inscrito parado confere o próprio cancelamento
+SUBSCRIBER_POLL = 0.1
+
+
+class _Flight:
+    """Uma geração no Ollama e o buffer de eventos compartilhado pelos inscritos"""
+
+    def __init__(self, key):
+        self.id = str(uuid.uuid4())
+        self.key = key
+        self.events = []
+        self.result = None
+        self.done = False
+        self.aborted = False
+        self.subscribers = 0
+        self.upstream_request_id = None
+        self.started_at = time.time()
+        self.cond = threading.Condition()
+
+
+class FlightSubscription:
+    """Lugar de um request numa geração compartilhada; sair é idempotente"""
+
+    def __init__(self, group, flight, leader):
+        self._group = group
+        self._flight = flight
+        self.leader = leader
+        self._left = False
+
+    def stream(self, request_id=None):
+        """Gerador: repassa os eventos desde o início e retorna o resultado da geração.
+
+        O cancelamento de `request_id` tira só este inscrito; a geração
+        continua enquanto houver outro lendo.
+        """
+        flight = self._flight
+        index = 0
+        content_parts = []
+        try:
+            while True:
+                if request_id and request_manager.is_cancelled(request_id):
+                    return {
+                        "content": ''.join(content_parts).strip(), "thinking": "", "chunks": index,
+                        "cancelled": True, "blocked": None, "error": None, "stats": {}
+                    }
+
+                with flight.cond:
+                    if index >= len(flight.events) and not flight.done:
+                        flight.cond.wait(SUBSCRIBER_POLL)
+                    pending = flight.events[index:]
+                    index += len(pending)
+                    finished = flight.done and index >= len(flight.events)
+
+                for event in pending:
+                    if event.get("type") == "content":
+                        content_parts.append(event["content"])
+                    yield event
+
+                if finished:
+                    result = dict(flight.result)
+                    result["coalesced"] = not self.leader
+                    return result
+        finally:
+            self.leave()
+
+    def leave(self):
+        if self._left:
+            return
+        self._left = True
+        self._group._leave(self._flight)
+
+
+class SingleFlight:
+    """Gerações idênticas simultâneas viram uma só no Ollama.
+
+    A primeira chamada (`lead`) abre a geração numa thread própria, que
+    grava cada evento num buffer; quem chega com a mesma chave enquanto ela
+    roda (`join`) lê o mesmo buffer desde o início. Cada inscrito tem seu
+    cancelamento, e o upstream só é fechado quando o último sai antes do
+    fim. Como a geração não pertence a nenhum request, ela usa um
+    request_id interno no RequestManager para poder ser abortada.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._stats = {'flights': 0, 'joined': 0, 'aborted': 0, 'max_subscribers': 0}
+        print(" SingleFlight inicializado")
+
+    def join(self, key):
+        """Inscreve-se numa geração em andamento com a mesma chave (ou None)"""
+        if key is None:
+            return None
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                return None
+            self._subscribe(flight)
+            self._stats['joined'] += 1
+        print(f" [FLIGHT] Request juntou-se à geração {flight.id[:8]}... ({flight.subscribers} inscritos)")
+        return FlightSubscription(self, flight, leader=False)
+
+    def lead(self, key, start_upstream):
+        """Abre a geração (ou entra na que já existe); `start_upstream(request_id)` devolve o gerador"""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._subscribe(flight)
+                self._stats['joined'] += 1
+                return FlightSubscription(self, flight, leader=False)
+
+            flight = _Flight(key)
+            flight.upstream_request_id = request_manager.start_request(f"__flight__{flight.id}")
+            self._subscribe(flight)
+            self._flights[key] = flight
+            self._stats['flights'] += 1
+
+        threading.Thread(
+            target=self._produce, args=(flight, start_upstream), daemon=True, name="single-flight"
+        ).start()
+        return FlightSubscription(self, flight, leader=True)
+
+    def _subscribe(self, flight):
+        """Chamar com lock"""
+        flight.subscribers += 1
+        self._stats['max_subscribers'] = max(self._stats['max_subscribers'], flight.subscribers)
+
+    def _produce(self, flight, start_upstream):
+        result = None
+        try:
+            upstream = start_upstream(flight.upstream_request_id)
+            while True:
+                try:
+                    event = next(upstream)
+                except StopIteration as stop:
+                    result = stop.value
+                    break
+                with flight.cond:
+                    flight.events.append(event)
+                    flight.cond.notify_all()
+        except Exception as e:
+            print(f" [FLIGHT] Erro na geração {flight.id[:8]}...: {e}")
+            result = {"content": "", "thinking": "", "chunks": 0, "cancelled": False,
+                      "blocked": None, "error": f"Erro no streaming: {str(e)}", "stats": {}}
+        finally:
+            with self._lock:
+                if self._flights.get(flight.key) is flight:
+                    del self._flights[flight.key]
+            with flight.cond:
+                flight.result = result or {"content": "", "thinking": "", "chunks": 0, "cancelled": True,
+                                           "blocked": None, "error": None, "stats": {}}
+                flight.done = True
+                flight.cond.notify_all()
+            request_manager.finish_request(flight.upstream_request_id)
+
+    def _leave(self, flight):
+        with self._lock:
+            flight.subscribers -= 1
+            if flight.subscribers > 0 or flight.done or flight.aborted:
+                return
+            # Último inscrito saiu antes do fim: ninguém mais lê esta geração
+            flight.aborted = True
+            if self._flights.get(flight.key) is flight:
+                del self._flights[flight.key]
+            self._stats['aborted'] += 1
+        print(f" [FLIGHT] Último inscrito saiu - abortando geração {flight.id[:8]}...")
+        request_manager.cancel_request(flight.upstream_request_id)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(
+                self._stats,
+                active=len(self._flights),
+                active_subscribers=sum(f.subscribers for f in self._flights.values())
+            )
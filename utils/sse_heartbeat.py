@@ -0,0 +1,70 @@
+"""
+Heartbeats SSE e detecção de cliente desconectado
+"""
+import queue
+import threading
+
+HEARTBEAT_FRAME = ": ping\n\n"
+
+# Frames aguardando escrita; acima disso a thread produtora espera
+MAX_PENDING_FRAMES = 256
+
+_DONE = object()
+
+
+def relay_with_heartbeat(source, interval, on_abandon=None):
+    """Repassa os frames de `source` enviando ': ping' a cada `interval`s sem eventos.
+
+    O gerador de origem roda numa thread produtora, então o socket continua
+    sendo escrito mesmo quando o modelo passa muito tempo sem emitir tokens
+    (carregando o modelo, pensando). Quando o navegador fecha a aba a escrita
+    falha, o servidor WSGI fecha este gerador (GeneratorExit) e `on_abandon`
+    é chamado para abortar a geração no Ollama.
+    """
+    frames = queue.Queue(maxsize=MAX_PENDING_FRAMES)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                frames.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for frame in source:
+                if not put(frame):
+                    break
+        except Exception as e:
+            put(e)
+        finally:
+            # Roda os finally da origem (libera request/backend) nesta mesma thread
+            source.close()
+            put(_DONE)
+
+    producer = threading.Thread(target=produce, daemon=True, name="sse-relay")
+    producer.start()
+
+    finished = False
+    try:
+        while True:
+            try:
+                item = frames.get(timeout=interval)
+            except queue.Empty:
+                yield HEARTBEAT_FRAME
+                continue
+
+            if item is _DONE:
+                finished = True
+                return
+            if isinstance(item, Exception):
+                finished = True
+                raise item
+            yield item
+    finally:
+        stopped.set()
+        if not finished and on_abandon:
+            on_abandon()
@@ -0,0 +1,111 @@
+"""
+Protocolo de eventos SSE do /chat-stream
+
+Versão 1 (legado): cada evento 'content' carrega também o 'buffer' com todo o
+texto limpo acumulado - é o formato que o static/script.js atual entende.
+
+Versão 2 (compacta): somente deltas, chaves curtas e checkpoints de integridade.
+    {"t":"meta","v":2}                       abertura do stream
+    {"t":"c","d":"..."}                      delta de conteúdo
+    {"t":"th","d":"..."}                     delta de pensamento
+    {"t":"td","d":"..."}                     pensamento completo
+    {"t":"ck","o":1234,"h":305419896}        checkpoint: offset + crc32
+    {"t":"done","d":"...","th":...,"s":{...},"o":...,"h":...}
+O offset 'o' conta caracteres de conteúdo emitidos até ali e 'h' é o CRC32
+(zlib) dos mesmos caracteres codificados em UTF-8. O 'd' do 'done' continua
+sendo o texto final autoritativo.
+"""
+import json
+import zlib
+
+PROTOCOL_LEGACY = 1
+PROTOCOL_COMPACT = 2
+SUPPORTED_PROTOCOLS = (PROTOCOL_LEGACY, PROTOCOL_COMPACT)
+
+CHECKPOINT_EVERY_CHARS = 2048
+
+_COMPACT_TYPES = {
+    'content': 'c',
+    'thinking': 'th',
+    'thinking_done': 'td',
+}
+
+
+def negotiate_protocol(requested):
+    """Resolve a versão pedida pelo cliente (padrão: legado)"""
+    try:
+        version = int(requested)
+    except (TypeError, ValueError):
+        return PROTOCOL_LEGACY
+    return version if version in SUPPORTED_PROTOCOLS else PROTOCOL_LEGACY
+
+
+class SSEEncoder:
+    """Codifica os eventos do AIClient em frames SSE na versão negociada"""
+
+    def __init__(self, protocol=PROTOCOL_LEGACY, checkpoint_every=CHECKPOINT_EVERY_CHARS):
+        self.protocol = negotiate_protocol(protocol)
+        self.checkpoint_every = checkpoint_every
+        self.offset = 0
+        self.crc = 0
+        self._since_checkpoint = 0
+        self._legacy_buffer = ""
+
+    def open(self):
+        """Frame de abertura (apenas no protocolo compacto)"""
+        if self.protocol == PROTOCOL_LEGACY:
+            return ""
+        return self._frame({"t": "meta", "v": self.protocol})
+
+    def encode(self, event):
+        """Converte um evento em um ou mais frames SSE"""
+        event_type = event.get("type")
+
+        if event_type == "content":
+            self._track(event["content"])
+
+        if self.protocol == PROTOCOL_LEGACY:
+            return self._frame(self._legacy_event(event))
+
+        if event_type in _COMPACT_TYPES:
+            key = "thinking" if event_type == "thinking_done" else "content"
+            frames = self._frame({"t": _COMPACT_TYPES[event_type], "d": event[key]})
+            if event_type == "content" and self._since_checkpoint >= self.checkpoint_every:
+                frames += self._checkpoint()
+            return frames
+
+        if event_type == "done":
+            return self._frame({
+                "t": "done",
+                "d": event.get("final_content", ""),
+                "th": event.get("thinking"),
+                "s": event.get("stats", {}),
+                "o": self.offset,
+                "h": self.crc
+            })
+
+        compact = {"t": event_type or ("error" if "error" in event else "event")}
+        compact.update((k, v) for k, v in event.items() if k != "type")
+        return self._frame(compact)
+
+    def _legacy_event(self, event):
+        if event.get("type") != "content":
+            return event
+        # Buffer acumulado só existe para clientes legados
+        self._legacy_buffer += event["content"]
+        legacy = dict(event)
+        legacy["buffer"] = self._legacy_buffer
+        return legacy
+
+    def _track(self, text):
+        self.offset += len(text)
+        self._since_checkpoint += len(text)
+        self.crc = zlib.crc32(text.encode("utf-8"), self.crc)
+
+    def _checkpoint(self):
+        self._since_checkpoint = 0
+        return self._frame({"t": "ck", "o": self.offset, "h": self.crc})
+
+    @staticmethod
+    def _frame(payload):
+        return f"data: {json.dumps(payload, ensure_ascii=False, separators=(',', ':'))}\n\n"
@@ -0,0 +1,68 @@
+"""
+Agrupamento de deltas do stream em menos frames SSE
+"""
+import time
+
+
+class DeltaCoalescer:
+    """Junta deltas consecutivos do mesmo tipo até `max_bytes` ou `max_delay_ms`.
+
+    Cada token do Ollama viraria um frame (json.dumps + write no socket);
+    aqui eles são agrupados. O primeiro delta de cada tipo sai na hora para
+    não atrasar o primeiro token, e a troca de tipo (pensamento -> conteúdo)
+    esvazia o que estava pendente. Só se retém texto quando o último frame
+    saiu há menos de `max_delay_ms` (stream rápido); com tokens lentos cada
+    delta sai na hora. O pendente sai ao estourar `max_bytes`, em `flush()`
+    ou em `due()` assim que o prazo vence: quem lê o upstream chama `due()`
+    a cada chunk recebido, mesmo os que não geram delta.
+    """
+
+    def __init__(self, max_bytes=256, max_delay_ms=30):
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay_ms / 1000
+        self.frames = 0
+        self.deltas = 0
+        self._kind = None
+        self._parts = []
+        self._bytes = 0
+        self._since = 0.0
+        self._last_frame = 0.0
+        self._sent_kinds = set()
+
+    def push(self, kind, text):
+        """Adiciona um delta; devolve a lista de eventos prontos para envio"""
+        self.deltas += 1
+        ready = self.due()
+        if self._parts and kind != self._kind:
+            ready.extend(self.flush())
+
+        now = time.monotonic()
+        if not self._parts:
+            self._kind = kind
+            self._since = now
+        self._parts.append(text)
+        self._bytes += len(text.encode('utf-8'))
+
+        if (kind not in self._sent_kinds
+                or self._bytes >= self.max_bytes
+                or now - self._last_frame >= self.max_delay):
+            ready.extend(self.flush())
+        return ready
+
+    def due(self):
+        """Esvazia o pendente se ele já espera há `max_delay_ms` ou mais"""
+        if self._parts and time.monotonic() - self._since >= self.max_delay:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """Esvazia o pendente (fronteiras de pensamento e fim do stream)"""
+        if not self._parts:
+            return []
+        event = {"type": self._kind, "content": ''.join(self._parts)}
+        self._parts = []
+        self._bytes = 0
+        self._sent_kinds.add(self._kind)
+        self._last_frame = time.monotonic()
+        self.frames += 1
+        return [event]
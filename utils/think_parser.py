@@ -0,0 +1,101 @@
+"""
+Parser incremental de blocos de pensamento (<think>) para o streaming
+"""
+
+THINK_TAGS = ('think', 'thinking', 'thought')
+
+
+class ThinkStreamParser:
+    """Máquina de estados que separa pensamento e conteúdo delta a delta.
+
+    Cada delta é consumido uma única vez: apenas um possível pedaço de tag
+    cortado entre dois chunks fica pendente, então o custo por token não
+    depende do tamanho da resposta acumulada.
+    """
+
+    def __init__(self, tags=THINK_TAGS):
+        self._open_tags = {f'<{tag}>': f'</{tag}>' for tag in tags}
+        self._all_tags = list(self._open_tags) + list(self._open_tags.values())
+        self._max_tag_len = max(len(tag) for tag in self._all_tags)
+        self._pending = ""
+        self._close_tag = None
+        self.blocks_closed = 0
+
+    @property
+    def inside_think(self):
+        return self._close_tag is not None
+
+    def feed(self, delta):
+        """Consome um delta e retorna lista de eventos (tipo, texto).
+
+        Tipos: 'content', 'thinking' e 'think_end' (bloco de pensamento fechado).
+        """
+        if not delta:
+            return []
+
+        text = self._pending + delta if self._pending else delta
+        self._pending = ""
+        events = []
+        pos = 0
+        length = len(text)
+
+        while pos < length:
+            lt = text.find('<', pos)
+            if lt == -1:
+                self._emit(events, text[pos:])
+                break
+
+            if lt > pos:
+                self._emit(events, text[pos:lt])
+
+            tail = text[lt:lt + self._max_tag_len]
+            tag = self._match_tag(tail)
+
+            if tag is None:
+                if lt + self._max_tag_len > length and self._is_partial_tag(tail):
+                    # Tag possivelmente cortada entre chunks - aguardar próximo delta
+                    self._pending = text[lt:]
+                    break
+                self._emit(events, '<')
+                pos = lt + 1
+                continue
+
+            if self._close_tag is None:
+                self._close_tag = self._open_tags[tag]
+            else:
+                self._close_tag = None
+                self.blocks_closed += 1
+                events.append(('think_end', ''))
+            pos = lt + len(tag)
+
+        return events
+
+    def flush(self):
+        """Libera texto pendente no fim do stream"""
+        events = []
+        if self._pending:
+            self._emit(events, self._pending)
+            self._pending = ""
+        return events
+
+    def _match_tag(self, tail):
+        if self._close_tag is not None:
+            return self._close_tag if tail.startswith(self._close_tag) else None
+        for tag in self._open_tags:
+            if tail.startswith(tag):
+                return tag
+        return None
+
+    def _is_partial_tag(self, tail):
+        if self._close_tag is not None:
+            return self._close_tag.startswith(tail)
+        return any(tag.startswith(tail) for tag in self._open_tags)
+
+    def _emit(self, events, text):
+        if not text:
+            return
+        kind = 'thinking' if self._close_tag is not None else 'content'
+        if events and events[-1][0] == kind:
+            events[-1] = (kind, events[-1][1] + text)
+        else:
+            events.append((kind, text))
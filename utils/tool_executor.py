@@ -0,0 +1,158 @@
+"""
+Execução paralela das ferramentas de um turno com prazos por ferramenta
+"""
+import threading
+import time
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+
+
+class ToolExecutor:
+    """Roda as tool calls independentes de um turno num pool limitado.
+
+    Só as ferramentas sem efeito colateral (`parallel_tools`, ex.: busca
+    web) rodam em paralelo. As demais (salvar/buscar/deletar na memória)
+    formam uma fila única do turno, executada em um worker na ordem em que
+    o modelo pediu: "salve X" seguido de "busque X" sempre vê o X salvo.
+    Cada ferramenta tem seu timeout (`tool_timeouts`, senão
+    `default_timeout`), contado a partir do envio para as paralelas e
+    acumulado ao longo da fila para as sequenciais, e o turno inteiro tem
+    um prazo (`turn_deadline`): o que não terminar a tempo vira um
+    resultado de erro e o turno segue com o restante; se uma sequencial
+    estourar, as seguintes da fila não chegam a rodar. Os resultados voltam
+    na ordem original das chamadas. Threads não podem ser interrompidas,
+    então uma ferramenta estourada continua ocupando um worker até
+    terminar; por isso o pool é limitado e compartilhado entre os requests.
+    """
+
+    def __init__(self, max_workers=8, default_timeout=10, tool_timeouts=None, turn_deadline=20,
+                 parallel_tools=()):
+        self.default_timeout = default_timeout
+        self.tool_timeouts = dict(tool_timeouts or {})
+        self.turn_deadline = turn_deadline
+        self.parallel_tools = frozenset(parallel_tools)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+        self._lock = threading.Lock()
+        self._tools = {}
+        self._stats = {'turns': 0, 'calls': 0, 'parallel_turns': 0, 'deadline_hits': 0, 'saved_ms': 0.0}
+        print(f" ToolExecutor inicializado - {max_workers} workers, prazo do turno {turn_deadline}s")
+
+    def run(self, calls):
+        """Executa [(nome, função sem argumentos)]; devolve [(resultado, ms)] na mesma ordem"""
+        if not calls:
+            return []
+        start = time.monotonic()
+        turn_end = start + self.turn_deadline
+
+        futures = []
+        serial = []
+        serial_end = start
+        for name, func in calls:
+            timeout = self.tool_timeouts.get(name, self.default_timeout)
+            if name in self.parallel_tools:
+                futures.append((name, self._pool.submit(self._timed, func), start + timeout, False))
+            else:
+                serial_end += timeout
+                future = Future()
+                serial.append((func, future))
+                futures.append((name, future, serial_end, True))
+        abort = threading.Event()
+        if serial:
+            self._pool.submit(self._run_serial, serial, abort)
+
+        results = []
+        durations = []
+        deadline_hit = False
+        for name, future, tool_end, in_queue in futures:
+            wait = max(min(tool_end, turn_end) - time.monotonic(), 0)
+            try:
+                resultado, elapsed_ms = future.result(timeout=wait)
+                timed_out = False
+            except FutureTimeoutError:
+                future.cancel()
+                if in_queue:
+                    abort.set()  # as próximas da fila não rodam depois desta
+                timed_out = True
+                deadline_hit = deadline_hit or tool_end > turn_end
+                elapsed_ms = (time.monotonic() - start) * 1000
+                resultado = {
+                    "status": "erro",
+                    "mensagem": f"A ferramenta {name} não respondeu a tempo"
+                }
+                print(f" [TOOLS] {name} estourou o prazo ({elapsed_ms:.0f}ms)")
+            except CancelledError:
+                elapsed_ms = 0
+                resultado = {
+                    "status": "erro",
+                    "mensagem": f"A ferramenta {name} não foi executada: uma anterior não respondeu a tempo"
+                }
+                timed_out = False
+            except Exception as e:
+                elapsed_ms = (time.monotonic() - start) * 1000
+                resultado = {"status": "erro", "mensagem": f"Erro na execução: {str(e)[:200]}"}
+                timed_out = False
+
+            durations.append(elapsed_ms)
+            self._record(name, elapsed_ms, timed_out, resultado)
+            results.append((resultado, round(elapsed_ms, 1)))
+
+        total_ms = (time.monotonic() - start) * 1000
+        with self._lock:
+            self._stats['turns'] += 1
+            self._stats['calls'] += len(calls)
+            if len(calls) > 1:
+                self._stats['parallel_turns'] += 1
+                # Tempo que a execução sequencial teria levado a mais
+                self._stats['saved_ms'] += max(sum(durations) - total_ms, 0)
+            if deadline_hit:
+                self._stats['deadline_hits'] += 1
+        if len(calls) > 1:
+            print(f" [TOOLS] {len(calls)} ferramentas em {total_ms:.0f}ms (sequencial: {sum(durations):.0f}ms)")
+        return results
+
+    @classmethod
+    def _run_serial(cls, serial, abort):
+        """Fila das ferramentas com efeito colateral: uma por vez, na ordem pedida"""
+        for func, future in serial:
+            if abort.is_set() or not future.set_running_or_notify_cancel():
+                future.cancel()
+                continue
+            try:
+                future.set_result(cls._timed(func))
+            except Exception as e:
+                future.set_exception(e)
+
+    @staticmethod
+    def _timed(func):
+        start = time.monotonic()
+        resultado = func()
+        return resultado, (time.monotonic() - start) * 1000
+
+    def _record(self, name, elapsed_ms, timed_out, resultado):
+        failed = timed_out or (isinstance(resultado, dict) and resultado.get('status') == 'erro')
+        with self._lock:
+            stats = self._tools.setdefault(name, {'calls': 0, 'errors': 0, 'timeouts': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+            stats['calls'] += 1
+            stats['total_ms'] += elapsed_ms
+            stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+            if timed_out:
+                stats['timeouts'] += 1
+            if failed:
+                stats['errors'] += 1
+
+    def get_stats(self):
+        with self._lock:
+            return dict(
+                self._stats,
+                saved_ms=round(self._stats['saved_ms'], 1),
+                turn_deadline_s=self.turn_deadline,
+                tools={
+                    name: {
+                        'calls': s['calls'],
+                        'errors': s['errors'],
+                        'timeouts': s['timeouts'],
+                        'avg_ms': round(s['total_ms'] / s['calls'], 1),
+                        'max_ms': round(s['max_ms'], 1)
+                    }
+                    for name, s in self._tools.items()
+                }
+            )
@@ -0,0 +1,187 @@
+"""
+Codificação compacta dos resultados de ferramentas devolvidos ao modelo
+"""
+import json
+import threading
+
+from tools.web_search import is_temporal_query
+from utils.context_budget import DEFAULT_CHARS_PER_TOKEN
+
+# Limite antigo: json.dumps(resultado)[:2000], usado como base de comparação
+LEGACY_MAX_CHARS = 2000
+
+# Nenhum campo de texto isolado passa disso antes de cortar itens
+MAX_FIELD_CHARS = 400
+
+# Abaixo disso um texto não é mais encurtado
+MIN_FIELD_CHARS = 40
+
+ELLIPSIS = "…"
+
+# Campos que só servem à interface ou a logs (o modelo nunca precisa)
+DROPPED_FIELDS = ('session_id', 'resultados_formatados', 'timestamp', 'tipo', 'relevancia',
+                  'total_resultados', 'resumo', 'fontes_com_erro', 'fontes_atrasadas')
+
+# Dado principal de cada ferramenta: vazio continua no resultado ("nada salvo" != chamada quebrada)
+PRIMARY_FIELDS = ('dados', 'categorias', 'resultados')
+
+
+def _dump(data):
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+
+
+def _prune(value, keep=()):
+    """Tira os campos descartáveis em qualquer nível (os de `keep` ficam mesmo vazios)"""
+    if isinstance(value, dict):
+        return {k: _prune(v) for k, v in value.items()
+                if k not in DROPPED_FIELDS and (k in keep or v not in (None, '', []))}
+    if isinstance(value, list):
+        return [_prune(v) for v in value]
+    return value
+
+
+def _clip(text, max_chars):
+    return text if len(text) <= max_chars else text[:max_chars - 1].rstrip() + ELLIPSIS
+
+
+def _clip_fields(value, max_chars):
+    if isinstance(value, dict):
+        return {k: _clip_fields(v, max_chars) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_clip_fields(v, max_chars) for v in value]
+    if isinstance(value, str):
+        return _clip(value, max_chars)
+    return value
+
+
+def _longest_string(value, path=()):
+    """(tamanho, caminho) do maior texto aninhado"""
+    best = (0, None)
+    items = value.items() if isinstance(value, dict) else enumerate(value) if isinstance(value, list) else ()
+    for key, child in items:
+        if isinstance(child, str):
+            candidate = (len(child), path + (key,))
+        else:
+            candidate = _longest_string(child, path + (key,))
+        if candidate[0] > best[0]:
+            best = candidate
+    return best
+
+
+def _encode_search(resultado):
+    data = {
+        "query": resultado.get("query"),
+        "resultados": [
+            {k: item.get(k) for k in ('titulo', 'conteudo', 'fonte', 'url')}
+            for item in resultado.get("resultados", [])
+        ],
+        "aviso": resultado.get("aviso_prioridade")
+    }
+    if is_temporal_query(resultado.get("query")):
+        data["atencao"] = "Verifique datas e sequências temporais"
+    return data
+
+
+def _encode_memory(resultado):
+    data = dict(resultado)
+    if "dados" in data:
+        data["dados"] = [{k: d.get(k) for k in ('chave', 'valor', 'categoria')} for d in data["dados"]]
+    if "categorias" in data:
+        data["categorias"] = {c["categoria"]: c["total_itens"] for c in data["categorias"]}
+    return data
+
+
+ENCODERS = {
+    'search_web_comprehensive': _encode_search,
+    'buscar_dados': _encode_memory,
+    'listar_categorias': _encode_memory,
+}
+
+
+class ToolResultEncoder:
+    """Resultado de ferramenta -> JSON compacto, sem duplicação, dentro de um orçamento.
+
+    O formato antigo mandava o dict inteiro (na busca web, os mesmos
+    resultados em markdown com emojis e na lista crua) cortado em 2000
+    caracteres, muitas vezes no meio de um objeto. Aqui cada ferramenta
+    escolhe o que o modelo usa, campos de interface e ecos (session_id,
+    status de sucesso, resumos) saem, o dado principal fica mesmo vazio
+    (com o total, "nada encontrado" é explícito), e o orçamento é cumprido encurtando
+    textos e tirando os últimos itens das listas, sempre reserializando:
+    a saída é JSON válido em qualquer caso. Erros viram {"erro": ...}.
+    """
+
+    def __init__(self, token_budget=600):
+        self.token_budget = token_budget
+        self._lock = threading.Lock()
+        self._stats = {'results': 0, 'legacy_tokens': 0, 'encoded_tokens': 0, 'clipped': 0}
+        self._tools = {}
+        print(f" ToolResultEncoder inicializado - {token_budget} tokens por resultado")
+
+    def encode(self, nome, resultado, chars_per_token=DEFAULT_CHARS_PER_TOKEN):
+        """Devolve (conteúdo da mensagem tool, tokens economizados em relação ao formato antigo)"""
+        if not isinstance(resultado, dict):
+            resultado = {"resultado": resultado}
+        legacy_chars = len(json.dumps(resultado, ensure_ascii=False)[:LEGACY_MAX_CHARS])
+
+        if resultado.get("status") == "erro":
+            data = {"erro": resultado.get("mensagem", "Erro desconhecido")}
+            if resultado.get("sugestao"):
+                data["sugestao"] = resultado["sugestao"]
+        else:
+            encoder = ENCODERS.get(nome)
+            data = encoder(resultado) if encoder else dict(resultado)
+            data.pop("status", None)
+        data = _prune(data, keep=PRIMARY_FIELDS)
+
+        text, clipped = self._fit(data, int(self.token_budget * chars_per_token))
+
+        legacy_tokens = int(legacy_chars / chars_per_token)
+        encoded_tokens = int(len(text) / chars_per_token)
+        with self._lock:
+            self._stats['results'] += 1
+            self._stats['legacy_tokens'] += legacy_tokens
+            self._stats['encoded_tokens'] += encoded_tokens
+            if clipped:
+                self._stats['clipped'] += 1
+            tool = self._tools.setdefault(nome, {'results': 0, 'saved_tokens': 0})
+            tool['results'] += 1
+            tool['saved_tokens'] += legacy_tokens - encoded_tokens
+        return text, legacy_tokens - encoded_tokens
+
+    @staticmethod
+    def _fit(data, max_chars):
+        """Serializa cabendo em `max_chars`; devolve (texto, se algo foi cortado)"""
+        text = _dump(data)
+        if len(text) <= max_chars:
+            return text, False
+
+        data = _clip_fields(data, MAX_FIELD_CHARS)
+        text = _dump(data)
+        omitted = 0
+        while len(text) > max_chars:
+            lists = [v for v in data.values() if isinstance(v, list) and len(v) > 1]
+            if lists:
+                max(lists, key=len).pop()
+                omitted += 1
+                data["omitidos"] = omitted
+            else:
+                size, path = _longest_string(data)
+                if size <= MIN_FIELD_CHARS:
+                    break  # não encolhe mais; continua válido, só acima do orçamento
+                parent = data
+                for key in path[:-1]:
+                    parent = parent[key]
+                parent[path[-1]] = _clip(parent[path[-1]], max(size // 2, MIN_FIELD_CHARS))
+            text = _dump(data)
+        return text, True
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['saved_tokens'] = stats['legacy_tokens'] - stats['encoded_tokens']
+            stats['saved_ratio'] = (round(stats['saved_tokens'] / stats['legacy_tokens'] * 100, 1)
+                                    if stats['legacy_tokens'] else 0)
+            stats['token_budget'] = self.token_budget
+            stats['tools'] = {name: dict(s) for name, s in self._tools.items()}
+            return stats